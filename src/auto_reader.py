@@ -1,22 +1,119 @@
 import os
+import sys
 import time
+import queue
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-import subprocess
-import sys
+
+from result_writer import OUTPUT_FORMATS, output_path
+from processed_store import ProcessedStore, STORE_NAME, file_sha256
+from profiling import add_profile_arguments, enable_from_args
+from extraction_backends import BACKENDS, DEFAULT_BACKEND
 
 PDF_INPUT_FOLDER = os.path.abspath("../pdfs")
 JSON_OUTPUT_FOLDER = os.path.abspath("../jsons")
+RESULT_FOLDER = os.path.abspath("../result")
+SCRIPTS_FOLDER = os.path.dirname(os.path.abspath(__file__))
 
 python_executable = sys.executable
 
-def pdf_to_json(pdf_path, json_path):
-    subprocess.run([python_executable, "pdf_to_json.py", pdf_path, json_path], cwd=os.path.dirname(__file__))
+#------------------------------------------------------------------------------------------------------------------------------------
+#------------------------------------------------------Modo Subprocesso--------------------------------------------------------------
+
+# Modo de isolamento: um interpretador novo por passo (mais lento, mas um crash no fitz não afeta o monitor).
+# check=True: um passo que falha (código de saída != 0) lança CalledProcessError e o PDF fica registado como falhado
+def pdf_to_json(pdf_path, json_path, backend=DEFAULT_BACKEND):
+    subprocess.run([python_executable, "pdf_to_json.py", pdf_path, json_path, "--backend", backend], cwd=SCRIPTS_FOLDER,
+                   check=True)
+
+def process_json(json_path, output_format="xlsx"):
+    subprocess.run([python_executable, "json_reader.py", json_path, "--output-format", output_format], cwd=SCRIPTS_FOLDER,
+                   check=True)
+
+def run_subprocess_pipeline(pdf_path, json_path, output_format="xlsx", backend=DEFAULT_BACKEND):
+    pdf_to_json(pdf_path, json_path, backend)
+    process_json(json_path, output_format)
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-------------------------------------------------------Modo In-Process--------------------------------------------------------------
+
+def warm_worker():
+    # Importa fitz e numpy uma única vez por worker, em vez de uma vez por PDF
+    import pdf_to_json
+    import json_reader
+    import pdf_to_items
 
-def process_json(json_path):
-    subprocess.run([python_executable, "json_reader.py", json_path], cwd=os.path.dirname(__file__))
+def run_inprocess_pipeline(pdf_path, json_path, result_folder, direct=False, output_format="xlsx", backend=DEFAULT_BACKEND):
+    from pdf_to_json import process_pdf
+    from json_reader import process_json_file
+    from pdf_to_items import process_pdf_direct
+    from profiling import profile_document
 
-processed_files = set()
+    os.makedirs(result_folder, exist_ok=True)
+    # Um único registo de profiling por PDF, com as etapas dos dois passos
+    with profile_document(pdf_path):
+        if direct:
+            out_path, _ = process_pdf_direct(pdf_path, result_folder, output_format=output_format, backend=backend)
+            return out_path
+        process_pdf(pdf_path, json_path, backend=backend)
+        return process_json_file(json_path, result_folder, output_format=output_format)
+
+class Pipeline:
+    def __init__(self, mode="inprocess", workers=1, intermediate_ext=".json", direct=False, output_format="xlsx",
+                 backend=DEFAULT_BACKEND):
+        self.mode = mode
+        self.backend = backend
+        self.output_format = output_format
+        self.intermediate_ext = intermediate_ext
+        self.direct = direct
+        self.workers = workers
+        self.executor = None
+        self.executor_lock = threading.Lock()
+        self.generation = 0  # Aumenta sempre que o pool é recriado
+        if mode == "inprocess":
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=warm_worker)
+
+    def submit(self, pdf_path, json_path):
+        with self.executor_lock:
+            return self.executor.submit(run_inprocess_pipeline, pdf_path, json_path, RESULT_FOLDER, self.direct,
+                                        self.output_format, self.backend)
+
+    def replace_executor(self, generation):
+        # Só o primeiro thread a ver o pool partido o recria; os outros já encontram o novo
+        with self.executor_lock:
+            if generation != self.generation:
+                return
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+            self.generation += 1
+        print("Um worker terminou de forma inesperada; pool de processos recriado.")
+
+    def run(self, pdf_path, json_path):
+        if self.executor is None:
+            run_subprocess_pipeline(pdf_path, json_path, self.output_format, self.backend)
+            return
+        # Um worker que morre (segfault do MuPDF, OOM) parte o pool e todos os PDFs em curso recebem BrokenProcessPool.
+        # Cada um tenta outra vez num pool novo: os inocentes passam, o que volta a partir o pool é o culpado e falha.
+        for attempt in range(2):
+            generation = self.generation
+            try:
+                return self.submit(pdf_path, json_path).result()
+            except BrokenProcessPool:
+                self.replace_executor(generation)
+                if attempt:
+                    raise
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Watcher------------------------------------------------------------------
 
 def is_file_ready(filepath):
     try:
@@ -25,50 +122,198 @@ def is_file_ready(filepath):
     except Exception:
         return False
 
+# Junta os eventos repetidos de cada ficheiro e só o liberta quando o tamanho e o mtime deixam de mudar
+# durante settle_seconds; os ficheiros prontos vão para uma fila limitada que os workers consomem.
+# Assim o thread do watchdog nunca fica bloqueado à espera de um ficheiro ou do processamento.
+class ReadyQueue:
+    def __init__(self, settle_seconds=1.0, poll_interval=0.25, maxsize=100):
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.pending = {}  # caminho -> (tamanho, mtime, desde quando está igual)
+        self.in_flight = set()  # caminhos já na fila ou a ser processados
+        self.dirty = set()  # caminhos em in_flight que mudaram entretanto (voltam a pending no done)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def touch(self, path):
+        with self.lock:
+            if path in self.in_flight:
+                self.dirty.add(path)
+            else:
+                self.pending.setdefault(path, None)
+
+    def discard(self, path):
+        with self.lock:
+            self.pending.pop(path, None)
+
+    def done(self, path):
+        # Se o PDF foi reescrito durante o processamento, volta a esperar que estabilize (o registo decide pela hash)
+        with self.lock:
+            self.in_flight.discard(path)
+            if path in self.dirty:
+                self.dirty.discard(path)
+                self.pending.setdefault(path, None)
+
+    def poll(self):
+        now = time.monotonic()
+        with self.lock:
+            paths = list(self.pending.items())
+        ready = []
+        for path, previous in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self.discard(path)
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if previous is None or previous[:2] != signature:
+                with self.lock:
+                    if path in self.pending:
+                        self.pending[path] = signature + (now,)
+                continue
+            if stat.st_size > 0 and now - previous[2] >= self.settle_seconds and is_file_ready(path):
+                ready.append(path)
+        for path in ready:
+            with self.lock:
+                if self.pending.pop(path, None) is None:
+                    continue
+                self.in_flight.add(path)
+            # Fila cheia: espera aqui (no thread do monitor), nunca no thread do watchdog
+            while not self.stop_event.is_set():
+                try:
+                    self.queue.put(path, timeout=self.poll_interval)
+                    break
+                except queue.Full:
+                    continue
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.poll()
+            self.stop_event.wait(self.poll_interval)
+
+    def stop(self):
+        self.stop_event.set()
+
+def process_ready_file(pdf_path, pipeline, store):
+    try:
+        stat = os.stat(pdf_path)
+        if store.find_unchanged(pdf_path, stat):
+            return
+        sha256 = file_sha256(pdf_path)
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        # Ex.: ainda bloqueado pelo scanner; volta a ser visto no próximo evento
+        print(f"Não foi possível ler {pdf_path}: {e}")
+        return
+    claimed, entry = store.claim(sha256, pdf_path, stat)
+    if not claimed:
+        if entry["path"] != pdf_path:
+            kind = "Duplicado de" if os.path.exists(entry["path"]) else "Renomeado de"
+            print(f"{kind} {entry['path']}, ignorado: {pdf_path}")
+        return
+    # A partir daqui a entrada está "processing": qualquer erro fica registado como failed para poder ser repetida
+    start = time.perf_counter()
+    try:
+        print(f"Novo PDF detectado: {pdf_path}")
+        base = os.path.splitext(os.path.basename(pdf_path))[0]
+        json_path = os.path.join(JSON_OUTPUT_FOLDER, f"{base}{pipeline.intermediate_ext}")
+        out_path = pipeline.run(pdf_path, json_path)
+        out_path = out_path or output_path(RESULT_FOLDER, base, pipeline.output_format)
+        if pipeline.direct and pipeline.executor is not None:
+            json_path = None  # modo direto: não há ficheiro intermédio
+        store.finish(sha256, time.perf_counter() - start, json_path=json_path, output_path=out_path)
+    except Exception as e:
+        store.finish(sha256, time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+        print(f"Ocorreu um erro ao processar {pdf_path}: {e}")
+
+def worker_loop(ready_queue, pipeline, store):
+    while True:
+        pdf_path = ready_queue.queue.get()
+        if pdf_path is None:
+            break
+        try:
+            process_ready_file(pdf_path, pipeline, store)
+        except Exception as e:
+            # Ex.: sqlite bloqueado no registo; o thread continua com o resto da fila
+            print(f"Ocorreu um erro ao processar {pdf_path}: {type(e).__name__}: {e}")
+        finally:
+            ready_queue.done(pdf_path)
+
 class PDFHandler(FileSystemEventHandler):
+    def __init__(self, ready_queue):
+        super().__init__()
+        self.ready_queue = ready_queue
+
     def on_created(self, event):
         self.handle_event(event)
 
     def on_modified(self, event):
         self.handle_event(event)
 
+    def on_moved(self, event):
+        # Renomeado dentro da pasta: o registo reconhece o conteúdo pela hash e não o reprocessa
+        self.on_deleted(event)
+        if not event.is_directory and event.dest_path.lower().endswith(".pdf"):
+            self.ready_queue.touch(event.dest_path)
+
     def on_deleted(self, event):
         if event.is_directory or not event.src_path.lower().endswith(".pdf"):
             return
-        base = os.path.splitext(os.path.basename(event.src_path))[0]
-        processed_files.discard(base)
+        self.ready_queue.discard(event.src_path)
 
     def handle_event(self, event):
         if event.is_directory or not event.src_path.lower().endswith(".pdf"):
             return
-        base = os.path.splitext(os.path.basename(event.src_path))[0]
-        if base in processed_files:
-            return
+        # Só regista o evento; a espera pelo ficheiro, a hash e o processamento acontecem noutros threads
+        self.ready_queue.touch(event.src_path)
 
-        base = os.path.splitext(os.path.basename(event.src_path))[0]
-        if base in processed_files:
-            return
-
-        # Espera até o ficheiro estar pronto para ser lido
-        for _ in range(10):
-            if is_file_ready(event.src_path):
-                break
-            time.sleep(0.5)
-        else:
-            print(f"Ficheiro {event.src_path} não está pronto para ser processado.")
-            return
-
-        print(f"Novo PDF detectado: {event.src_path}")
-
-        json_path = os.path.join(JSON_OUTPUT_FOLDER, f"{base}.json")
-        pdf_to_json(event.src_path, json_path)
-        process_json(json_path)
-        processed_files.add(base)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Monitoriza a pasta de PDFs e converte cada novo ficheiro.")
+    parser.add_argument("--mode", choices=["inprocess", "subprocess"], default="inprocess",
+                        help="inprocess: workers quentes (por defeito); subprocess: um interpretador por passo (isolamento)")
+    parser.add_argument("--workers", type=int, default=1, help="Número de PDFs processados em paralelo")
+    parser.add_argument("--format", choices=["json", "wbin"], default="json", help="Formato do ficheiro intermédio de palavras")
+    parser.add_argument("--direct", action="store_true",
+                        help="Modo inprocess: não grava o ficheiro intermédio de palavras (PDF -> itens em memória)")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="xlsx",
+                        help="Formato do resultado: xlsx (por defeito), csv ou parquet (precisa do pyarrow)")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="Motor de extração (ver extraction_backends.py)")
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="Segundos sem mudanças de tamanho/mtime para considerar um PDF pronto")
+    parser.add_argument("--db", default=os.path.join(RESULT_FOLDER, STORE_NAME),
+                        help="Registo SQLite dos PDFs processados (por hash do conteúdo)")
+    parser.add_argument("--queue-size", type=int, default=100, help="Tamanho máximo da fila de PDFs prontos")
+    add_profile_arguments(parser)
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
+    # Antes de criar os workers: a configuração passa por variáveis de ambiente (também para o modo subprocess)
+    enable_from_args(args)
     watch_path = PDF_INPUT_FOLDER
     os.makedirs(JSON_OUTPUT_FOLDER, exist_ok=True)
-    event_handler = PDFHandler()
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    store = ProcessedStore(args.db)
+    interrupted = store.reset_interrupted()
+    if interrupted:
+        print(f"{interrupted} PDF(s) interrompidos na última execução serão reprocessados.")
+    pipeline = Pipeline(mode=args.mode, workers=args.workers, intermediate_ext=f".{args.format}", direct=args.direct,
+                        output_format=args.output_format, backend=args.backend)
+    ready_queue = ReadyQueue(settle_seconds=args.settle, maxsize=args.queue_size)
+    monitor = threading.Thread(target=ready_queue.run, daemon=True)
+    monitor.start()
+    workers = [threading.Thread(target=worker_loop, args=(ready_queue, pipeline, store), daemon=True) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+
+    # Retoma: os PDFs que já estão na pasta passam pelo registo (os já processados são ignorados)
+    for filename in sorted(os.listdir(watch_path)):
+        if filename.lower().endswith(".pdf"):
+            ready_queue.touch(os.path.join(watch_path, filename))
+
+    event_handler = PDFHandler(ready_queue)
     observer = Observer()
     observer.schedule(event_handler, watch_path, recursive=False)
     observer.start()
@@ -78,4 +323,12 @@ if __name__ == "__main__":
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
-    observer.join()
\ No newline at end of file
+    observer.join()
+    ready_queue.stop()
+    monitor.join()
+    for _ in workers:
+        ready_queue.queue.put(None)
+    for worker in workers:
+        worker.join()
+    pipeline.shutdown()
+    store.close()
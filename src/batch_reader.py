@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from result_writer import OUTPUT_FORMATS, ConsolidatedWriter, output_path
+from profiling import add_profile_arguments, enable_from_args, profile_document
+from extraction_cache import DEFAULT_MAX_MB, ExtractionCache, print_stats
+from extraction_backends import BACKENDS, DEFAULT_BACKEND
+
+PDF_INPUT_FOLDER = os.path.abspath("../pdfs")
+JSON_OUTPUT_FOLDER = os.path.abspath("../jsons")
+RESULT_FOLDER = os.path.abspath("../result")
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Worker-------------------------------------------------------------------
+
+def warm_worker():
+    # Importa fitz e numpy uma única vez por worker
+    import pdf_to_json
+    import json_reader
+    import pdf_to_items
+
+def process_document(pdf_path, json_folder, result_folder, intermediate_ext=".json", stream=False, direct=False,
+                     output_format="xlsx", cache_folder=None, cache_max_mb=DEFAULT_MAX_MB, return_items=False,
+                     backend=DEFAULT_BACKEND):
+    # return_items: não grava resultado por documento, devolve os itens para o processo principal os consolidar
+    from pdf_to_json import process_pdf, count_pages
+    from json_reader import load_pages, iter_page_stores, extract_items_json, extract_items_streaming
+    from result_writer import output_path, write_items
+    from pdf_to_items import extract_items_pdf
+
+    base = os.path.splitext(os.path.basename(pdf_path))[0]
+    json_path = os.path.join(json_folder, f"{base}{intermediate_ext}")
+    out_path = output_path(result_folder, base, output_format)
+    result = {"pdf": pdf_path, "pages": 0, "items": 0, "output": None, "error": None}
+
+    start = time.perf_counter()
+    try:
+        with profile_document(pdf_path) as profile:
+            if cache_folder:
+                # Palavras e itens vêm da cache quando o PDF (e a versão do extrator) já foram vistos
+                with ExtractionCache(cache_folder, max_bytes=cache_max_mb << 20) as cache:
+                    json_items = cache.items(pdf_path, backend=backend)
+                result["pages"] = count_pages(pdf_path, backend)
+            elif direct:
+                # Sem ficheiro intermédio: páginas da memória direto para o extrator
+                result["pages"] = count_pages(pdf_path, backend)
+                json_items = extract_items_pdf(pdf_path, backend=backend)
+            elif stream:
+                result["pages"] = process_pdf(pdf_path, json_path, backend=backend)
+                json_items = extract_items_streaming(iter_page_stores(json_path))
+            else:
+                result["pages"] = process_pdf(pdf_path, json_path, backend=backend)
+                with profile.stage("load_words"):
+                    pages = load_pages(json_path)
+                json_items = extract_items_json(pages)
+            if return_items:
+                result["json_items"] = json_items
+            else:
+                with profile.stage("write_results"):
+                    write_items(json_items, out_path, output_format)
+                result["output"] = out_path
+        result["items"] = len(json_items)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Batch--------------------------------------------------------------------
+
+def list_pdfs(input_folder, result_folder, skip_existing=False, output_format="xlsx"):
+    pdf_paths = []
+    for filename in sorted(os.listdir(input_folder)):
+        if not filename.lower().endswith(".pdf"):
+            continue
+        if skip_existing:
+            if os.path.exists(output_path(result_folder, os.path.splitext(filename)[0], output_format)):
+                continue
+        pdf_paths.append(os.path.join(input_folder, filename))
+    return pdf_paths
+
+def run_batch(pdf_paths, json_folder, result_folder, workers=None, intermediate_ext=".json", stream=False, direct=False,
+              output_format="xlsx", cache_folder=None, cache_max_mb=DEFAULT_MAX_MB, consolidated_path=None,
+              backend=DEFAULT_BACKEND):
+    os.makedirs(json_folder, exist_ok=True)
+    os.makedirs(result_folder, exist_ok=True)
+
+    results = []
+    start = time.perf_counter()
+    # Resultado único do lote: cada documento é acrescentado quando acaba e os seus itens são logo libertados
+    consolidated = ConsolidatedWriter(consolidated_path) if consolidated_path else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_worker) as executor:
+        futures = [
+            executor.submit(process_document, pdf_path, json_folder, result_folder, intermediate_ext, stream, direct,
+                            output_format, cache_folder, cache_max_mb, consolidated is not None, backend)
+            for pdf_path in pdf_paths
+        ]
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                json_items = result.pop("json_items", None)
+                if consolidated is not None and json_items is not None:
+                    consolidated.write_document(os.path.basename(result["pdf"]), json_items)
+                    result["output"] = consolidated_path
+                results.append(result)
+                status = "ERRO" if result["error"] else "ok"
+                print(f"[{done}/{len(futures)}] {os.path.basename(result['pdf'])}: {status} ({result['seconds']:.2f}s)")
+        finally:
+            if consolidated is not None:
+                consolidated.close()
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+def summarize(results, elapsed):
+    errors = [r for r in results if r["error"]]
+    total_pages = sum(r["pages"] for r in results)
+    total_items = sum(r["items"] for r in results)
+    elapsed = max(elapsed, 1e-9)
+    return {
+        "documents": len(results),
+        "errors": len(errors),
+        "pages": total_pages,
+        "items": total_items,
+        "seconds": elapsed,
+        "documents_per_second": len(results) / elapsed,
+        "pages_per_second": total_pages / elapsed,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Processa uma pasta de PDFs em paralelo (PDF -> JSON -> itens -> Excel).")
+    parser.add_argument("--input", default=PDF_INPUT_FOLDER, help="Pasta com os PDFs de entrada")
+    parser.add_argument("--jsons", default=JSON_OUTPUT_FOLDER, help="Pasta para os JSONs intermédios")
+    parser.add_argument("--result", default=RESULT_FOLDER, help="Pasta para os Excels de resultado")
+    parser.add_argument("--workers", type=int, default=None, help="Número de processos (por defeito: número de CPUs)")
+    parser.add_argument("--format", choices=["json", "wbin"], default="json", help="Formato do ficheiro intermédio de palavras")
+    parser.add_argument("--stream", action="store_true", help="Processa uma página de cada vez (memória limitada pela maior página)")
+    parser.add_argument("--direct", action="store_true", help="Não grava o ficheiro intermédio de palavras (PDF -> itens em memória)")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="xlsx",
+                        help="Formato do resultado: xlsx (por defeito), csv ou parquet (precisa do pyarrow)")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help="Motor de extração (ver extraction_backends.py)")
+    parser.add_argument("--cache", metavar="PASTA",
+                        help="Usa a cache de palavras/itens nesta pasta (ver extraction_cache.py); ignora --stream/--direct")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_MB, help="Tamanho máximo da cache (remoção LRU)")
+    parser.add_argument("--consolidated", metavar="FICHEIRO",
+                        help="Junta os itens de todos os PDFs num único .xlsx/.csv/.parquet (com ficheiro, página e y)")
+    parser.add_argument("--skip-existing", action="store_true", help="Ignora PDFs que já têm resultado no formato pedido")
+    parser.add_argument("--report", help="Grava o resultado por ficheiro e o resumo neste JSON")
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    enable_from_args(args)
+    pdf_paths = list_pdfs(args.input, args.result, skip_existing=args.skip_existing, output_format=args.output_format)
+    if not pdf_paths:
+        print("Nenhum PDF para processar.")
+    else:
+        results, elapsed = run_batch(pdf_paths, args.jsons, args.result, workers=args.workers,
+                                     intermediate_ext=f".{args.format}", stream=args.stream, direct=args.direct,
+                                     output_format=args.output_format, cache_folder=args.cache,
+                                     cache_max_mb=args.cache_max_mb, consolidated_path=args.consolidated,
+                                     backend=args.backend)
+        summary = summarize(results, elapsed)
+
+        for r in results:
+            if r["error"]:
+                print(f"Erro em {r['pdf']}: {r['error']}")
+        print(
+            f"{summary['documents']} documentos ({summary['errors']} com erro), {summary['pages']} páginas "
+            f"em {summary['seconds']:.2f}s: {summary['documents_per_second']:.2f} docs/s, "
+            f"{summary['pages_per_second']:.2f} páginas/s"
+        )
+
+        if args.cache:
+            with ExtractionCache(args.cache, max_bytes=args.cache_max_mb << 20) as cache:
+                print_stats(cache.stats())
+
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                json.dump({"summary": summary, "files": results}, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,430 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+
+from json_reader import QUANTITY_KEYWORDS, extract_items_json, load_pages, write_items_excel
+from layout_templates import LayoutTemplates
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#------------------------------------------------------Dados Sintéticos--------------------------------------------------------------
+
+def synthetic_word(text, x, y, width=30, size=9):
+    return {
+        "text": text,
+        "x": x,
+        "y": y,
+        "width": width,
+        "height": size,
+        "font": "Helvetica",
+        "size": size,
+        "rotation": 0
+    }
+
+def synthetic_table_page(rows, row_spacing=14, page_number=1):
+    # Cabeçalho com coluna de quantidade + uma linha de item por row
+    words = [
+        synthetic_word("Ref", 40, 100),
+        synthetic_word("Descrição", 120, 100, width=60),
+        synthetic_word("Qtd", 330, 100, width=20),
+        synthetic_word("UN", 380, 100, width=15),
+        synthetic_word("Preço", 440, 100, width=30),
+    ]
+    y = 100
+    for row in range(rows):
+        y += row_spacing
+        words.append(synthetic_word(f"A{row:05d}", 40, y))
+        words.append(synthetic_word("Parafuso M8", 120, y, width=60))
+        words.append(synthetic_word(str(row % 9 + 1), 332, y, width=6))
+        words.append(synthetic_word("UN", 380, y, width=15))
+        words.append(synthetic_word(f"{row % 97},50", 440, y, width=25))
+    return {"page": page_number, "words": words}
+
+def make_synthetic_pdf(pdf_path, pages=10, rows=40, with_images=False, seed=0):
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    image = None
+    if with_images:
+        # Logótipo de 200x200 como nas encomendas reais (é o que o modo "fast" evita descodificar)
+        pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 200), False)
+        pixmap.set_rect(pixmap.irect, (30, 90, 160))
+        image = pixmap.tobytes("png")
+    for page_index in range(pages):
+        page = doc.new_page()
+        if image is not None:
+            page.insert_image(fitz.Rect(420, 20, 560, 80), stream=image)
+        page.insert_text((40, 60), f"Encomenda {page_index + 1}", fontsize=12)
+        for x, header in ((40, "Ref"), (120, "Descrição"), (330, "Qtd"), (380, "UN"), (440, "Preço")):
+            page.insert_text((x, 100), header, fontsize=9)
+        y = 118
+        for row in range(rows):
+            if y > 800:
+                break
+            page.insert_text((40, y), f"A{rng.randint(100, 999)}", fontsize=9)
+            page.insert_text((120, y), rng.choice(["Parafuso M8", "Porca", "Anilha inox"]), fontsize=9)
+            page.insert_text((330, y), rng.choice(["1,00", "12", "3"]), fontsize=9)
+            page.insert_text((380, y), "UN", fontsize=9)
+            page.insert_text((440, y), f"{rng.randint(1, 99)},50", fontsize=9)
+            y += 16
+    doc.save(pdf_path)
+    doc.close()
+
+DESCRIPTIONS = ["Parafuso M8", "Porca sextavada", "Anilha inox A2", "Casquilho", "Rebite cego 4x10", "Mola de compressão"]
+UNITS = ["UN", "PCS", "KG", "MT"]
+
+def make_order_pdf(pdf_path, pages=10, rows=40, keywords=None, noise=0.0, seed=0):
+    # Encomenda sintética: cabeçalho com uma das QUANTITY_KEYWORDS por página e, com noise > 0, ruído de layout
+    # (coordenadas desalinhadas até noise pontos, tamanhos de letra variáveis, notas soltas entre linhas)
+    import fitz
+
+    rng = random.Random(seed)
+    keywords = keywords or QUANTITY_KEYWORDS
+    doc = fitz.open()
+
+    def jitter():
+        return rng.uniform(-noise, noise) if noise else 0
+
+    for page_index in range(pages):
+        page = doc.new_page()
+        page.insert_text((40, 50), f"Encomenda N.º {rng.randint(10000, 99999)}", fontsize=12)
+        page.insert_text((40, 66), f"Data: 2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", fontsize=9)
+        keyword = rng.choice(keywords).capitalize()
+        for x, header in ((40, "Ref"), (120, "Descrição"), (330, keyword), (380, "UN"), (440, "Preço")):
+            page.insert_text((x + jitter(), 100), header, fontsize=9)  # Cabeçalho na mesma linha (é o que a deteção procura)
+        y = 118
+        for row in range(rows):
+            if y > 800:
+                break
+            size = 9 + (rng.uniform(-1, 1) if noise else 0)
+            page.insert_text((40 + jitter(), y + jitter()), f"A{rng.randint(100, 999)}", fontsize=size)
+            page.insert_text((120 + jitter(), y + jitter()), rng.choice(DESCRIPTIONS), fontsize=size)
+            page.insert_text((330 + jitter(), y + jitter()), rng.choice(["1,00", "12", "3", "250", "0,5"]), fontsize=size)
+            page.insert_text((380 + jitter(), y + jitter()), rng.choice(UNITS), fontsize=size)
+            page.insert_text((440 + jitter(), y + jitter()), f"{rng.randint(1, 99)},50", fontsize=size)
+            y += 16
+            if noise and rng.random() < 0.1 and y <= 800:
+                page.insert_text((130 + jitter(), y), "Nota: entrega parcial", fontsize=7)
+                y += 12
+    doc.save(pdf_path)
+    doc.close()
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#----------------------------------------------------------Benchmarks----------------------------------------------------------------
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_line_windowing(row_counts, repeat=3):
+    # Tempo por linha deve manter-se ~constante se o custo por página for linear no número de linhas
+    print(f"{'linhas':>8} {'ms':>10} {'us/linha':>10}")
+    for rows in row_counts:
+        pages = [synthetic_table_page(rows)]
+        elapsed = best_time(lambda: extract_items_json(pages), repeat)
+        print(f"{rows:>8} {elapsed * 1000:>10.2f} {elapsed * 1e6 / rows:>10.2f}")
+
+def bench_extraction_modes(pdf_path, repeat=3):
+    import fitz
+    from pdf_to_json import EXTRACTION_MODES, extract_words_with_rotation
+
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+        results = {}
+        for mode in EXTRACTION_MODES:
+            words = [extract_words_with_rotation(page, mode) for page in doc]
+            elapsed = best_time(lambda: [extract_words_with_rotation(page, mode) for page in doc], repeat)
+            results[mode] = (elapsed, words)
+
+    baseline_time, baseline_words = results["dict"]
+    print(f"{'modo':>6} {'ms/página':>10} {'speedup':>8} {'iguais':>7}")
+    for mode, (elapsed, words) in results.items():
+        print(f"{mode:>6} {elapsed * 1000 / page_count:>10.3f} {baseline_time / elapsed:>7.2f}x {str(words == baseline_words):>7}")
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-------------------------------------------------------Suite por Etapa--------------------------------------------------------------
+
+def measure(func, repeat):
+    # Melhor tempo em repeat corridas; o pico de memória (alocações Python, via tracemalloc) numa corrida à parte,
+    # para o tracemalloc não pesar nos tempos. O fitz aloca em C, por isso na extração o pico é só a parte Python.
+    elapsed = best_time(func, repeat)
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def bench_pipeline_stages(pdf_path, work_folder, repeat=3):
+    import fitz
+    from pdf_to_json import extract_words_with_rotation, process_pdf
+
+    json_path = os.path.join(work_folder, "bench.json")
+    excel_path = os.path.join(work_folder, "bench.xlsx")
+
+    def extract_words():
+        with fitz.open(pdf_path) as doc:
+            return [extract_words_with_rotation(page) for page in doc]
+
+    words_per_page = extract_words()
+    page_count = len(words_per_page)
+    word_count = sum(len(words) for words in words_per_page)
+    process_pdf(pdf_path, json_path)
+    pages = load_pages(json_path)
+    items = extract_items_json(pages)
+
+    stages = [
+        ("extract_words_with_rotation", extract_words, word_count, "palavras"),
+        ("process_pdf", lambda: process_pdf(pdf_path, json_path), page_count, "páginas"),
+        ("extract_items_json", lambda: extract_items_json(pages), word_count, "palavras"),
+        ("write_items_excel", lambda: write_items_excel(items, excel_path), len(items), "itens"),
+    ]
+    results = {}
+    for name, func, units, unit_name in stages:
+        elapsed, peak, _ = measure(func, repeat)
+        results[name] = {
+            "seconds": elapsed,
+            "pages_per_second": page_count / elapsed,
+            "units": units,
+            "unit": unit_name,
+            "units_per_second": units / elapsed,
+            "peak_mb": peak / 2 ** 20,
+        }
+    return {"pages": page_count, "words": word_count, "items": len(items), "stages": results}
+
+def run_suite(pages, rows, noise, repeat=3, seed=0, output=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "orders.pdf")
+        make_order_pdf(pdf_path, pages=pages, rows=rows, noise=noise, seed=seed)
+        measured = bench_pipeline_stages(pdf_path, tmp, repeat=repeat)
+
+    print(f"{measured['pages']} páginas, {measured['words']} palavras, {measured['items']} itens")
+    print(f"{'etapa':<28} {'ms':>10} {'páginas/s':>10} {'débito':>22} {'pico MB':>8}")
+    for name, stage in measured["stages"].items():
+        print(f"{name:<28} {stage['seconds'] * 1000:>10.1f} {stage['pages_per_second']:>10.1f} "
+              f"{stage['units_per_second']:>10.0f} {stage['unit'] + '/s':<11} {stage['peak_mb']:>8.1f}")
+
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"pages": pages, "rows": rows, "noise": noise, "repeat": repeat, "seed": seed},
+        **measured,
+    }
+    if output:
+        # Uma linha JSON por corrida, para comparar versões e apanhar regressões
+        with open(output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"Resultados acrescentados a {output}")
+    return record
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#------------------------------------------------------Tempo de Arranque-------------------------------------------------------------
+
+# Módulos que não podem ser carregados pelo núcleo (só pelos escritores/extratores que precisam deles)
+HEAVY_MODULES = ("pandas", "fitz", "pymupdf", "xlsxwriter", "pyarrow")
+IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+def measure_import(module, repeat=5):
+    # Interpretador novo em cada corrida (é o custo que o modo subprocess do auto_reader paga por documento)
+    best = None
+    heavy = ""
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                   capture_output=True, text=True, check=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        # Última linha: o fitz escreve um aviso de deprecação no stdout quando é importado
+        elapsed, _, heavy = completed.stdout.strip().splitlines()[-1].partition(" ")
+        best = float(elapsed) if best is None else min(best, float(elapsed))
+    return best, [m for m in heavy.split(",") if m]
+
+def bench_imports(modules, budget_ms=None, repeat=5):
+    print(f"{'módulo':<16} {'ms':>8}  pesados carregados")
+    failed = False
+    for module in modules:
+        elapsed, heavy = measure_import(module, repeat)
+        over_budget = budget_ms is not None and elapsed * 1000 > budget_ms
+        failed = failed or over_budget or (module == "json_reader" and bool(heavy))
+        print(f"{module:<16} {elapsed * 1000:>8.1f}  {', '.join(heavy) or '-'}{'  ACIMA DO ORÇAMENTO' if over_budget else ''}")
+    return not failed
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------Equivalência---------------------------------------------------------------
+
+# Cópia congelada do json_reader original (tests/src_v2): as otimizações do extrator têm de dar exatamente os mesmos itens
+REFERENCE_JSON_READER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "src_v2", "json_reader.py")
+
+EQUIVALENCE_VOCAB = ["Ref", "Descrição", "UN", "PCS", "Preço", "Total", "Artigo", "Cx", "kg", "Parafuso", "M8", "Porca", "IVA", "-", "x"]
+EQUIVALENCE_KEYWORDS = ["Qtd", "Quantidade", "QT.", "Quantity", "q", "Qtd."]
+EQUIVALENCE_QUANTITIES = ["1,00", "12", "3.5", "100", "2,5", "7", "abc1", "0,25", "+4", "1.000,00"]
+
+def load_reference_extractor(path=REFERENCE_JSON_READER):
+    # O original importa o pandas (como os protótipos em tests/)
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location("reference_json_reader", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.extract_items_json
+
+def random_order_pages(seed):
+    # Páginas de palavras aleatórias com os casos difíceis: y em .5 (arredondamento), cabeçalhos em falta,
+    # linhas coladas ou muito afastadas, larguras variadas, páginas vazias e palavras fora de ordem
+    rng = random.Random(seed)
+    pages = []
+    for page_index in range(rng.randint(1, 3)):
+        words = []
+        if rng.random() < 0.1:
+            pages.append({"page": page_index + 1, "words": []})
+            continue
+        columns = sorted(rng.sample(range(20, 560, 10), rng.randint(2, 7)))
+        header_y = rng.choice([80.0, 100.5, 120.3, 99.5])
+        has_header = rng.random() < 0.85
+        for column_index, column_x in enumerate(columns):
+            text = rng.choice(EQUIVALENCE_KEYWORDS) if has_header and column_index == 1 else rng.choice(EQUIVALENCE_VOCAB)
+            if has_header or rng.random() < 0.5:
+                words.append(dict(text=text, x=column_x + rng.random(), y=header_y + rng.choice([0, 0.2, -0.4]),
+                                  width=rng.choice([10, 18.5, 25, 4]), height=9, font="Helv", size=9, rotation=0))
+        y = header_y
+        for _ in range(rng.randint(0, 40)):
+            y += rng.choice([12, 12, 12.5, 6, 24, 3, 30, 45])
+            for column_index, column_x in enumerate(columns):
+                if rng.random() < 0.3:
+                    continue
+                if column_index == 1 or rng.random() < 0.3:
+                    text = rng.choice(EQUIVALENCE_QUANTITIES)
+                else:
+                    text = rng.choice(EQUIVALENCE_VOCAB)
+                words.append(dict(text=text, x=column_x + rng.choice([0, 0.5, 1.5, -2, 5]), y=y + rng.choice([0, 0.49, 0.5, -0.5, 1.2]),
+                                  width=rng.choice([8, 12.5, 30, 3]), height=9, font=rng.choice(["Helv", "Cour", None]),
+                                  size=rng.choice([9, 8.5]), rotation=0))
+        if rng.random() < 0.3:
+            rng.shuffle(words)
+        pages.append({"page": page_index + 1, "words": words})
+    return pages
+
+def run_extractor(extract, pages, **kwargs):
+    # Itens ou o tipo da exceção: o NameError sem delta_x do original também faz parte do comportamento
+    try:
+        return "ok", extract(pages, **kwargs)
+    except Exception as e:
+        return "erro", type(e).__name__
+
+def check_equivalence(cases=3000, pdfs=4, seed=0):
+    # Compara extract_items_json (também com modelos de layout, em miss e em hit) com o original,
+    # em páginas aleatórias e em PDFs sintéticos; devolve True se não houver diferenças
+    from pdf_to_json import extract_pages
+
+    reference = load_reference_extractor()
+    layouts = LayoutTemplates()
+    stats = {"comparisons": 0, "mismatches": 0}
+
+    def compare(label, pages):
+        for kwargs in ({}, {"y_margin_possible_values": 15}):
+            expected = run_extractor(reference, pages, **kwargs)
+            variants = [
+                ("", run_extractor(extract_items_json, pages, **kwargs)),
+                ("layouts (miss)", run_extractor(extract_items_json, pages, layouts=layouts, **kwargs)),
+                ("layouts (hit)", run_extractor(extract_items_json, pages, layouts=layouts, **kwargs)),
+            ]
+            for variant, result in variants:
+                stats["comparisons"] += 1
+                if result != expected:
+                    stats["mismatches"] += 1
+                    if stats["mismatches"] <= 5:
+                        print(f"Diferença: {label} {kwargs or ''} {variant}")
+
+    for case in range(cases):
+        compare(f"páginas aleatórias seed={seed + case}", random_order_pages(seed + case))
+    with tempfile.TemporaryDirectory() as tmp:
+        for index in range(pdfs):
+            pdf_path = os.path.join(tmp, f"order{index}.pdf")
+            make_order_pdf(pdf_path, pages=5, rows=30, noise=2.0 if index % 2 else 0.0, seed=seed + index)
+            compare(f"PDF sintético {index}", extract_pages(pdf_path))
+
+    print(f"{stats['comparisons']} comparações com o json_reader original, {stats['mismatches']} diferenças "
+          f"({layouts.summary()})")
+    return stats["mismatches"] == 0
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks das etapas do pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    lines_parser = subparsers.add_parser("lines", help="Escalamento de extract_items_json com o número de linhas por página")
+    lines_parser.add_argument("--rows", type=int, nargs="+", default=[100, 200, 400, 800, 1600, 3200])
+    lines_parser.add_argument("--repeat", type=int, default=3)
+
+    extract_parser = subparsers.add_parser("extract", help="Tempo por página dos modos de extração do PyMuPDF (dict vs fast)")
+    extract_parser.add_argument("--pdf", help="PDF a usar; por defeito gera um sintético com imagens")
+    extract_parser.add_argument("--pages", type=int, default=20)
+    extract_parser.add_argument("--repeat", type=int, default=3)
+
+    suite_parser = subparsers.add_parser("suite", help="Tempo, débito e pico de memória de cada etapa numa encomenda sintética")
+    suite_parser.add_argument("--pages", type=int, default=50)
+    suite_parser.add_argument("--rows", type=int, default=40, help="Linhas de itens por página")
+    suite_parser.add_argument("--noise", type=float, default=2.0, help="Ruído de layout em pontos (0 = alinhado)")
+    suite_parser.add_argument("--seed", type=int, default=0)
+    suite_parser.add_argument("--repeat", type=int, default=3)
+    suite_parser.add_argument("--output", default="../benchmark_results.jsonl", help="Ficheiro JSON Lines onde acrescentar o resultado")
+
+    imports_parser = subparsers.add_parser("imports", help="Tempo de import de cada módulo num interpretador novo")
+    imports_parser.add_argument("--modules", nargs="+", default=["json_reader", "result_writer", "pdf_to_json", "auto_reader"])
+    imports_parser.add_argument("--budget-ms", type=float,
+                                help="Falha (código de saída 1) se algum import passar disto ou se o json_reader carregar módulos pesados")
+    imports_parser.add_argument("--repeat", type=int, default=5)
+
+    equivalence_parser = subparsers.add_parser("equivalence",
+                                               help="Compara o extrator atual com a cópia congelada do original (tests/src_v2)")
+    equivalence_parser.add_argument("--cases", type=int, default=3000, help="Documentos de páginas aleatórias")
+    equivalence_parser.add_argument("--pdfs", type=int, default=4, help="PDFs sintéticos (extraídos com o PyMuPDF)")
+    equivalence_parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "lines":
+        bench_line_windowing(args.rows, repeat=args.repeat)
+    elif args.command == "extract":
+        if args.pdf:
+            bench_extraction_modes(args.pdf, repeat=args.repeat)
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                pdf_path = os.path.join(tmp, "synthetic.pdf")
+                make_synthetic_pdf(pdf_path, pages=args.pages, with_images=True)
+                bench_extraction_modes(pdf_path, repeat=args.repeat)
+    elif args.command == "suite":
+        run_suite(args.pages, args.rows, args.noise, repeat=args.repeat, seed=args.seed, output=args.output)
+    elif args.command == "imports":
+        if not bench_imports(args.modules, budget_ms=args.budget_ms, repeat=args.repeat):
+            sys.exit(1)
+    elif args.command == "equivalence":
+        if not check_equivalence(args.cases, args.pdfs, args.seed):
+            sys.exit(1)
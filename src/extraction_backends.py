@@ -0,0 +1,210 @@
+import io
+import re
+import os
+import time
+import json
+import argparse
+from bisect import bisect_left
+
+BACKENDS = ("pymupdf", "pdfplumber")
+DEFAULT_BACKEND = "pymupdf"
+
+# Prefixo das fontes embebidas parcialmente ("ABCDEF+Helvetica"); o PyMuPDF já o retira
+SUBSET_PREFIX = re.compile(r"^[A-Z]{6}\+")
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------pdfplumber---------------------------------------------------------------
+
+# Segundo motor de extração (o dos protótipos em tests/), com o mesmo esquema da camada de palavras do
+# pdf_to_json.py: text, x, y, width, height, font, size, rotation. keep_blank_chars junta as palavras separadas
+# por espaços como os spans do PyMuPDF; o texto vertical é ignorado da mesma forma.
+def open_pdfplumber(source):
+    try:
+        import pdfplumber
+    except ImportError:
+        raise ImportError("O motor pdfplumber precisa do pdfplumber (pip install pdfplumber)")
+    if isinstance(source, (bytes, bytearray)):
+        return pdfplumber.open(io.BytesIO(source))
+    return pdfplumber.open(source)
+
+def pdfplumber_words(page):
+    word_list = []
+    for word in page.extract_words(keep_blank_chars=True, extra_attrs=["fontname", "size"]):
+        width = word["x1"] - word["x0"]
+        height = word["bottom"] - word["top"]
+        if not word.get("upright", True) or height > 3 * width:
+            continue  # Ignora possível texto vertical
+        word_list.append({
+            "text": word["text"],
+            "x": word["x0"],
+            "y": word["top"],
+            "width": width,
+            "height": height,
+            "font": SUBSET_PREFIX.sub("", word.get("fontname") or "") or None,
+            "size": word.get("size"),
+            "rotation": 0
+        })
+    return word_list
+
+def pdfplumber_page_range(source, start=0, end=None):
+    pages = []
+    with open_pdfplumber(source) as pdf:
+        for page_index in range(start, len(pdf.pages) if end is None else end):
+            page = pdf.pages[page_index]
+            pages.append({"page": page_index + 1, "words": pdfplumber_words(page)})
+            page.close()  # Liberta a cache de objetos da página (senão cresce com o documento)
+    return pages
+
+def iter_pdfplumber_pages(source):
+    with open_pdfplumber(source) as pdf:
+        for page_number, page in enumerate(pdf.pages, start=1):
+            yield {"page": page_number, "words": pdfplumber_words(page)}
+            page.close()
+
+def pdfplumber_page_count(source):
+    with open_pdfplumber(source) as pdf:
+        return len(pdf.pages)
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Comparação---------------------------------------------------------------
+
+def match_words(words_a, words_b, tolerance):
+    # Emparelha palavras com o mesmo texto (sem espaços nas pontas) cuja posição difere no máximo tolerance em x e em y;
+    # devolve os pares (a, b). Os dois motores medem o topo da caixa de forma diferente, daí a tolerância.
+    by_text = {}
+    for word in words_b:
+        by_text.setdefault(word["text"].strip(), []).append(word)
+    for candidates in by_text.values():
+        candidates.sort(key=lambda w: w["y"])
+
+    pairs = []
+    for word in words_a:
+        candidates = by_text.get(word["text"].strip())
+        if not candidates:
+            continue
+        ys = [w["y"] for w in candidates]
+        best = None
+        for i in range(bisect_left(ys, word["y"] - tolerance), len(candidates)):
+            other = candidates[i]
+            if other["y"] > word["y"] + tolerance:
+                break
+            distance = abs(other["x"] - word["x"]) + abs(other["y"] - word["y"])
+            if abs(other["x"] - word["x"]) <= tolerance and (best is None or distance < best[0]):
+                best = (distance, i)
+        if best is not None:
+            pairs.append((word, candidates.pop(best[1])))
+    return pairs
+
+def backend_pages(pdf_path, backend, mode="dict"):
+    if backend == "pdfplumber":
+        return list(iter_pdfplumber_pages(pdf_path))
+    from pdf_to_json import extract_pages
+    return extract_pages(pdf_path, mode=mode)
+
+def warm_up(backends, pdf_path, mode="dict"):
+    # Imports (fitz, pdfplumber/pdfminer) e inicializações do primeiro uso ficam fora das medições
+    for backend in backends:
+        backend_pages(pdf_path, backend, mode)
+
+def compare_backends(pdf_path, backends=BACKENDS, mode="dict", tolerance=4.0, repeat=3):
+    # Tempo por página de cada motor (o melhor de repeat execuções) e concordância palavra a palavra com o
+    # primeiro (a referência)
+    timings = {}
+    pages_by_backend = {}
+    for backend in backends:
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            pages_by_backend[backend] = backend_pages(pdf_path, backend, mode)
+            seconds = time.perf_counter() - start
+            timings[backend] = min(seconds, timings.get(backend, seconds))
+
+    reference = backends[0]
+    page_count = len(pages_by_backend[reference])
+    report = {"pdf": pdf_path, "pages": page_count, "backends": {}}
+    for backend in backends:
+        entry = {
+            "seconds": timings[backend],
+            "ms_per_page": 1000 * timings[backend] / max(page_count, 1),
+            "words": sum(len(p["words"]) for p in pages_by_backend[backend]),
+        }
+        if backend != reference:
+            matched = 0
+            dx = dy = 0.0
+            font_mismatches = 0
+            for page_a, page_b in zip(pages_by_backend[reference], pages_by_backend[backend]):
+                pairs = match_words(page_a["words"], page_b["words"], tolerance)
+                matched += len(pairs)
+                dx += sum(abs(a["x"] - b["x"]) for a, b in pairs)
+                dy += sum(abs(a["y"] - b["y"]) for a, b in pairs)
+                font_mismatches += sum(1 for a, b in pairs if a["font"] != b["font"] or abs((a["size"] or 0) - (b["size"] or 0)) > 0.01)
+            reference_words = report["backends"][reference]["words"]
+            entry.update({
+                "matched": matched,
+                # Palavras da referência encontradas neste motor e vice-versa
+                "recall": matched / reference_words if reference_words else 1.0,
+                "precision": matched / entry["words"] if entry["words"] else 1.0,
+                "mean_dx": dx / matched if matched else None,
+                "mean_dy": dy / matched if matched else None,
+                "font_mismatches": font_mismatches,
+                "page_count_equal": len(pages_by_backend[backend]) == page_count,
+            })
+        report["backends"][backend] = entry
+    return report
+
+def print_report(report):
+    print(f"{report['pdf']} ({report['pages']} páginas)")
+    for backend, entry in report["backends"].items():
+        line = f"  {backend:<10} {entry['ms_per_page']:8.1f} ms/página  {entry['words']:>7} palavras"
+        if "matched" in entry:
+            line += (f"  concordância {entry['recall']:.1%} / {entry['precision']:.1%}"
+                     f"  |dx| {entry['mean_dx'] or 0:.2f}  |dy| {entry['mean_dy'] or 0:.2f}"
+                     f"  fonte/tamanho diferentes {entry['font_mismatches']}")
+        print(line)
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#------------------------------------------------------------CLI---------------------------------------------------------------------
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compara os motores de extração (tempo por página e concordância das palavras) sobre um conjunto de PDFs.")
+    parser.add_argument("pdf_paths", nargs="+", help="PDFs ou pastas com PDFs")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS),
+                        help="Motores a comparar; o primeiro é a referência da concordância")
+    parser.add_argument("--mode", choices=["dict", "fast"], default="dict", help="Modo de extração do PyMuPDF")
+    parser.add_argument("--tolerance", type=float, default=4.0, help="Diferença máxima em x e y (pontos) para duas palavras baterem")
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções por PDF e motor; conta a mais rápida")
+    parser.add_argument("--report", metavar="FICHEIRO", help="Grava o relatório de cada PDF neste ficheiro (JSON Lines)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    pdf_paths = []
+    for path in args.pdf_paths:
+        if os.path.isdir(path):
+            pdf_paths.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.lower().endswith(".pdf"))
+        else:
+            pdf_paths.append(path)
+
+    totals = {backend: [0.0, 0] for backend in args.backends}
+    if pdf_paths:
+        try:
+            warm_up(args.backends, pdf_paths[0], args.mode)
+        except Exception as e:
+            print(f"Ocorreu um erro ao aquecer os motores com {pdf_paths[0]}: {e}")
+    for pdf_path in pdf_paths:
+        try:
+            report = compare_backends(pdf_path, args.backends, args.mode, args.tolerance, args.repeat)
+        except Exception as e:
+            print(f"Ocorreu um erro ao processar {pdf_path}: {e}")
+            continue
+        print_report(report)
+        for backend, entry in report["backends"].items():
+            totals[backend][0] += entry["seconds"]
+            totals[backend][1] += report["pages"]
+        if args.report:
+            with open(args.report, "a", encoding="utf-8") as f:
+                f.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+    print("Total:")
+    for backend, (seconds, pages) in totals.items():
+        print(f"  {backend:<10} {1000 * seconds / max(pages, 1):8.1f} ms/página ({pages} páginas)")
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+
+from processed_store import file_sha256
+from extraction_backends import BACKENDS, DEFAULT_BACKEND
+
+CACHE_FOLDER = os.path.abspath("../cache")
+INDEX_NAME = "index.sqlite"
+DEFAULT_MAX_MB = 2048
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key          TEXT PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    path         TEXT NOT NULL,
+    size         INTEGER NOT NULL,
+    content_hash TEXT,
+    created      REAL NOT NULL,
+    last_access  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    kind   TEXT PRIMARY KEY,
+    hits   INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+def remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def key_of(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#------------------------------------------------------------Cache-------------------------------------------------------------------
+
+# Cache em disco com dois níveis, endereçada pelo conteúdo:
+#   words  hash do PDF + WORD_LAYER_VERSION + modo (+ motor) -> camada de palavras (.wbin)
+#   items  hash da camada de palavras + EXTRACTOR_VERSION + parâmetros -> itens (.json)
+# Mudar só os parâmetros do extrator (ex: y_margin_possible_values) reaproveita as palavras sem voltar ao fitz;
+# e se a nova versão da extração der as mesmas palavras, os itens também são reaproveitados.
+# O índice (SQLite) guarda tamanho e último acesso de cada entrada para a remoção LRU, e os contadores de hits/misses.
+class ExtractionCache:
+    def __init__(self, folder=CACHE_FOLDER, max_bytes=DEFAULT_MAX_MB << 20):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        for kind in ("words", "items"):
+            os.makedirs(os.path.join(folder, kind), exist_ok=True)
+        # timeout: vários workers do batch_reader podem partilhar a mesma cache
+        self.conn = sqlite3.connect(os.path.join(folder, INDEX_NAME), timeout=30)
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        self.evict()  # O limite pode ter baixado desde a última execução
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def lookup(self, kind, key):
+        row = self.conn.execute("SELECT path, content_hash FROM entries WHERE key = ?", (key,)).fetchone()
+        hit = row is not None and os.path.exists(row[0])
+        with self.conn:
+            if hit:
+                self.conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            elif row is not None:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))  # Ficheiro apagado à mão
+            self.conn.execute("INSERT OR IGNORE INTO counters (kind) VALUES (?)", (kind,))
+            column = "hits" if hit else "misses"
+            self.conn.execute(f"UPDATE counters SET {column} = {column} + 1 WHERE kind = ?", (kind,))
+        return row if hit else None
+
+    def store(self, kind, key, tmp_path, path, content_hash=None):
+        os.replace(tmp_path, path)
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, path, size, content_hash, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, path, os.path.getsize(path), content_hash, now, now)
+            )
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        # Remove as entradas usadas há mais tempo até o total caber em max_bytes (menos a que acabou de ser gravada)
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removed = []
+        for key, path, size in self.conn.execute("SELECT key, path, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            removed.append((key,))
+            total -= size
+        with self.conn:
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", removed)
+
+    def word_layer(self, pdf_path, mode="dict", backend=DEFAULT_BACKEND):
+        # Devolve (caminho do .wbin, hash do .wbin); só chama o motor de extração em caso de miss
+        from pdf_to_json import WORD_LAYER_VERSION
+
+        key_parts = ["words", file_sha256(pdf_path), WORD_LAYER_VERSION, mode]
+        if backend != DEFAULT_BACKEND:
+            key_parts.append(backend)  # As entradas do PyMuPDF mantêm a chave de antes
+        key = key_of(*key_parts)
+        row = self.lookup("words", key)
+        if row is not None:
+            return row[0], row[1]
+
+        from pdf_to_json import process_pdf
+        path = os.path.join(self.folder, "words", f"{key}.wbin")
+        tmp_path = f"{path}.{os.getpid()}.tmp.wbin"
+        try:
+            process_pdf(pdf_path, tmp_path, mode=mode, backend=backend)
+            words_hash = file_sha256(tmp_path)
+        except BaseException:
+            remove_if_exists(tmp_path)  # Fora do índice nunca seria removido pela remoção LRU
+            raise
+        self.store("words", key, tmp_path, path, words_hash)
+        return path, words_hash
+
+    def items(self, pdf_path, y_margin_possible_values=None, mode="dict", backend=DEFAULT_BACKEND):
+        from json_reader import EXTRACTOR_VERSION, extract_items_json, load_pages
+
+        words_path, words_hash = self.word_layer(pdf_path, mode, backend)
+        key = key_of("items", words_hash, EXTRACTOR_VERSION, {"y_margin_possible_values": y_margin_possible_values})
+        row = self.lookup("items", key)
+        if row is not None:
+            with open(row[0], encoding="utf-8") as f:
+                return json.load(f)
+
+        # Erros do extrator não ficam em cache (voltam a acontecer no próximo pedido)
+        json_items = extract_items_json(load_pages(words_path), y_margin_possible_values)
+        path = os.path.join(self.folder, "items", f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(json_items, f, ensure_ascii=False)
+        except BaseException:
+            remove_if_exists(tmp_path)
+            raise
+        self.store("items", key, tmp_path, path)
+        return json_items
+
+    def stats(self):
+        result = {kind: {"hits": 0, "misses": 0, "entries": 0, "bytes": 0} for kind in ("words", "items")}
+        for kind, hits, misses in self.conn.execute("SELECT kind, hits, misses FROM counters"):
+            result[kind].update(hits=hits, misses=misses)
+        for kind, entries, size in self.conn.execute("SELECT kind, COUNT(*), SUM(size) FROM entries GROUP BY kind"):
+            result[kind].update(entries=entries, bytes=size)
+        return result
+
+    def clear(self):
+        for (path,) in self.conn.execute("SELECT path FROM entries").fetchall():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self.conn:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.execute("DELETE FROM counters")
+
+def print_stats(stats):
+    for kind, values in stats.items():
+        lookups = values["hits"] + values["misses"]
+        ratio = values["hits"] / lookups if lookups else 0
+        print(f"{kind:<6} hits {values['hits']:>6}  misses {values['misses']:>6}  ({ratio:.0%})  "
+              f"{values['entries']} entradas, {values['bytes'] / 2 ** 20:.1f} MB")
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#------------------------------------------------------------CLI---------------------------------------------------------------------
+
+def parse_margin(value):
+    return None if value == "auto" else int(value)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Extrai itens através da cache (ex: varrer y_margin_possible_values sobre o histórico sem repetir o fitz).")
+    parser.add_argument("pdf_paths", nargs="*")
+    parser.add_argument("--cache", default=CACHE_FOLDER, help="Pasta da cache")
+    parser.add_argument("--max-mb", type=int, default=DEFAULT_MAX_MB, help="Tamanho máximo da cache (remoção LRU)")
+    parser.add_argument("--mode", choices=["dict", "fast"], default="dict", help="Modo de extração do PyMuPDF")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="Motor de extração (ver extraction_backends.py)")
+    parser.add_argument("--y-margin", type=parse_margin, nargs="+", default=[None],
+                        help="Valores de y_margin_possible_values a experimentar ('auto' = calculado por página)")
+    parser.add_argument("--stats", action="store_true", help="Mostra só os contadores da cache")
+    parser.add_argument("--clear", action="store_true", help="Apaga a cache")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    with ExtractionCache(args.cache, max_bytes=args.max_mb << 20) as cache:
+        if args.clear:
+            cache.clear()
+            print("Cache apagada.")
+        for pdf_path in args.pdf_paths:
+            for margin in args.y_margin:
+                try:
+                    json_items = cache.items(pdf_path, y_margin_possible_values=margin, mode=args.mode, backend=args.backend)
+                    print(f"{pdf_path} (y_margin={'auto' if margin is None else margin}): {len(json_items)} itens")
+                except Exception as e:
+                    print(f"Ocorreu um erro ao processar {pdf_path}: {e}")
+        if args.stats or args.pdf_paths:
+            print_stats(cache.stats())
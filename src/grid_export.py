@@ -0,0 +1,174 @@
+import os
+import csv
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from json_reader import iter_page_stores
+from wordbin import is_wordbin
+
+JSON_INPUT_FOLDER = os.path.abspath("../jsons")
+GRID_OUTPUT_FOLDER = os.path.abspath("../grids")
+GRID_FORMATS = ("txt", "tsv")
+
+# Divisões horizontais da "grelha invisível" (em pontos PDF), as mesmas dos protótipos em tests/
+COLUNAS_X = [0, 20, 40, 60, 80, 200, 220, 240, 260, 280, 300, 320, 340, 360, 380, 400, 420, 440, 460, 480, 500, 520, 540, 560, 580, 600]
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Grelha-------------------------------------------------------------------
+
+def grid_rows(store, start, end, colunas_x):
+    # Linhas (y arredondado, de cima para baixo) da página com uma célula por coluna da grelha. A coluna de cada palavra
+    # vem de uma pesquisa binária no x inicial (colunas_x[i] <= x < colunas_x[i + 1]); palavras fora da grelha são ignoradas.
+    # Cada célula junta os textos pela ordem do documento, como nos protótipos.
+    column_count = len(colunas_x) - 1
+    columns = np.searchsorted(colunas_x, store.x[start:end], side="right") - 1
+    line_y = np.rint(store.y[start:end]).astype(np.int64)
+    lines = {}
+    for i in np.flatnonzero((columns >= 0) & (columns < column_count)).tolist():
+        cells = lines.get(line_y[i])
+        if cells is None:
+            cells = lines[line_y[i]] = [[] for _ in range(column_count)]
+        cells[columns[i]].append(store.texts[store.text_ids[start + i]])
+    return [(int(y), ["".join(text + " " for text in cells).strip() for cells in lines[y]]) for y in sorted(lines)]
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Escrita------------------------------------------------------------------
+
+# Texto como o notepad dos protótipos: "--- Página N ---" e as células não vazias separadas por tabs
+class GridTextWriter:
+    def __init__(self, path, colunas_x):
+        self.f = open(path, "w", encoding="utf-8")
+        self.first_line = True
+
+    def write_line(self, line):
+        self.f.write(line if self.first_line else "\n" + line)
+        self.first_line = False
+
+    def write_page(self, page_number, rows):
+        self.write_line(f"\n--- Página {page_number} ---")
+        for _, cells in rows:
+            self.write_line("\t".join(cell for cell in cells if cell))
+
+    def close(self):
+        self.f.close()
+
+# TSV com a grelha inteira (células vazias incluídas): página, y e uma coluna por intervalo de colunas_x
+class GridTsvWriter:
+    def __init__(self, path, colunas_x):
+        self.f = open(path, "w", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.f, delimiter="\t", lineterminator="\n")
+        self.writer.writerow(["Pagina", "Y"] + [f"{a:g}-{b:g}" for a, b in zip(colunas_x, colunas_x[1:])])
+
+    def write_page(self, page_number, rows):
+        self.writer.writerows([page_number, y] + cells for y, cells in rows)
+
+    def close(self):
+        self.f.close()
+
+GRID_WRITERS = {"txt": GridTextWriter, "tsv": GridTsvWriter}
+
+def iter_source_stores(source_path):
+    # Camada de palavras já gravada (.json/.wbin), lida página a página; um PDF é extraído em memória
+    if source_path.lower().endswith(".pdf"):
+        from pdf_to_json import iter_page_stores as iter_pdf_page_stores
+        return iter_pdf_page_stores(source_path)
+    return iter_page_stores(source_path)
+
+def export_grid(source_path, out_path, grid_format="txt", colunas_x=COLUNAS_X):
+    # Escreve cada página assim que é lida; só cria o ficheiro se houver alguma linha na grelha.
+    # Devolve o número de páginas com conteúdo.
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    writer = None
+    pages = 0
+    try:
+        for store in iter_source_stores(source_path):
+            for page, start, end in store.page_ranges():
+                rows = grid_rows(store, start, end, colunas_x)
+                if not rows:
+                    continue
+                if writer is None:
+                    writer = GRID_WRITERS[grid_format](tmp_path, colunas_x)
+                writer.write_page(page, rows)
+                pages += 1
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        raise
+    if writer is not None:
+        writer.close()
+        os.replace(tmp_path, out_path)
+    return pages
+
+def export_one(source_path, output_folder, grid_format, colunas_x):
+    base_name = os.path.splitext(os.path.basename(source_path))[0]
+    out_path = os.path.join(output_folder, f"{base_name}.{grid_format}")
+    start = time.perf_counter()
+    pages = export_grid(source_path, out_path, grid_format, colunas_x)
+    return source_path, (out_path if pages else None), pages, time.perf_counter() - start
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#------------------------------------------------------------CLI---------------------------------------------------------------------
+
+def list_sources(input_folder):
+    return [
+        os.path.join(input_folder, f) for f in sorted(os.listdir(input_folder))
+        if f.endswith(".json") or is_wordbin(f)
+    ]
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Exporta a camada de palavras em grelha (texto como o notepad dos protótipos, ou TSV), página a página.")
+    parser.add_argument("source_paths", nargs="*",
+                        help="Camadas de palavras (.json/.wbin) ou PDFs; sem argumentos exporta ../jsons")
+    parser.add_argument("--format", choices=GRID_FORMATS, default="txt", help="txt (notepad) ou tsv (grelha completa)")
+    parser.add_argument("--output", default=GRID_OUTPUT_FOLDER, help="Pasta de saída")
+    parser.add_argument("--columns", type=float, nargs="+", default=COLUNAS_X, help="Divisões da grelha em pontos PDF")
+    parser.add_argument("--workers", type=int, default=1, help="Documentos exportados em paralelo")
+    parser.add_argument("--force", action="store_true", help="Reescreve as exportações que já existem")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    colunas_x = sorted(args.columns)
+    source_paths = args.source_paths
+    if not source_paths:
+        if not os.path.exists(JSON_INPUT_FOLDER):
+            print("Pasta JSONs não encontrada.")
+            raise SystemExit(1)
+        source_paths = list_sources(JSON_INPUT_FOLDER)
+    os.makedirs(args.output, exist_ok=True)
+
+    pending = []
+    for source_path in source_paths:
+        out_name = f"{os.path.splitext(os.path.basename(source_path))[0]}.{args.format}"
+        if not args.force and os.path.exists(os.path.join(args.output, out_name)):
+            print(f"Ignorado (já existe): {out_name}")
+            continue
+        pending.append(source_path)
+
+    def report(source_path, out_path, pages, seconds):
+        if out_path:
+            print(f"Criado: {out_path} ({pages} páginas, {seconds:.2f}s)")
+        else:
+            print(f"Nenhum conteúdo relevante encontrado: {source_path}")
+
+    if args.workers <= 1:
+        for source_path in pending:
+            try:
+                report(*export_one(source_path, args.output, args.format, colunas_x))
+            except Exception as e:
+                print(f"Ocorreu um erro ao processar {source_path}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {
+                executor.submit(export_one, source_path, args.output, args.format, colunas_x): source_path
+                for source_path in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    report(*future.result())
+                except Exception as e:
+                    print(f"Ocorreu um erro ao processar {futures[future]}: {e}")
@@ -0,0 +1,294 @@
+import io
+import json
+import time
+import asyncio
+import argparse
+import multiprocessing
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from extraction_backends import BACKENDS, DEFAULT_BACKEND
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_BODY_MB = 50
+REQUEST_TIMEOUT = 120
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Worker-------------------------------------------------------------------
+
+def warm_worker():
+    # Importa fitz, numpy e o xlsxwriter uma única vez por worker
+    import pdf_to_items
+    import result_writer
+
+def extract_items_bytes(pdf_bytes, output_format="json", mode="dict", backend=DEFAULT_BACKEND):
+    # Corre no worker: o PDF é aberto a partir dos bytes, sem ficheiros temporários
+    from pdf_to_json import count_pages
+    from pdf_to_items import extract_items_pdf
+    from result_writer import write_items
+
+    start = time.perf_counter()
+    try:
+        pages = count_pages(pdf_bytes, backend)
+        json_items = extract_items_pdf(pdf_bytes, mode=mode, backend=backend)
+    except Exception as e:
+        # PDF corrompido ou sem cabeçalho reconhecível: erro do pedido, não do serviço
+        return {"error": f"{type(e).__name__}: {e}"}
+    if output_format == "xlsx":
+        buffer = io.BytesIO()
+        write_items(json_items, buffer, "xlsx")
+        return {"xlsx": buffer.getvalue()}
+    return {"pages": pages, "items": json_items, "seconds": time.perf_counter() - start}
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Serviço------------------------------------------------------------------
+
+# Servidor HTTP asyncio mínimo (só biblioteca padrão): o loop só lê e escreve sockets, a extração corre num
+# ProcessPoolExecutor já aquecido. No máximo max_concurrent PDFs em processamento e max_queue à espera;
+# acima disso responde 503 em vez de acumular pedidos em memória.
+class ExtractionService:
+    def __init__(self, workers=2, max_concurrent=None, max_queue=32, max_body_bytes=MAX_BODY_MB << 20,
+                 timeout=REQUEST_TIMEOUT):
+        self.workers = workers
+        self.max_concurrent = max_concurrent or workers
+        self.max_queue = max_queue
+        self.max_body_bytes = max_body_bytes
+        self.timeout = timeout
+        self.executor = self.new_executor()
+        self.generation = 0  # Aumenta sempre que o pool é recriado
+        self.slots = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.served = 0
+
+    def new_executor(self):
+        # spawn (o que o Windows já usa): um worker criado por fork com o serviço a correr, quando o pool é recriado,
+        # herdaria os sockets abertos e o cliente nunca via a ligação fechar
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker,
+                                   mp_context=multiprocessing.get_context("spawn"))
+
+    def warm_up(self):
+        # Arranca já todos os processos (o pool só os cria quando há trabalho)
+        for future in [self.executor.submit(time.sleep, 0.05) for _ in range(self.workers)]:
+            future.result()
+
+    async def start(self, host=HOST, port=PORT):
+        self.slots = asyncio.Semaphore(self.max_concurrent)
+        await asyncio.get_running_loop().run_in_executor(None, self.warm_up)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    def pool_broken(self):
+        # O ProcessPoolExecutor marca-se como partido quando um worker morre, mesmo sem pedidos em curso
+        return bool(getattr(self.executor, "_broken", False))
+
+    def replace_executor(self, generation):
+        # Os pedidos que apanharam o mesmo pool partido só o recriam uma vez (tudo corre no thread do loop)
+        if generation != self.generation:
+            return
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = self.new_executor()
+        self.generation += 1
+        print("Um worker terminou de forma inesperada; pool de processos recriado.")
+
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "Pedido HTTP inválido")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if method == "POST":
+            if "content-length" not in headers:
+                raise HttpError(411, "Content-Length em falta")
+            try:
+                length = int(headers["content-length"])
+            except ValueError:
+                raise HttpError(400, "Content-Length inválido")
+            if length < 0:
+                raise HttpError(400, "Content-Length inválido")
+            if length > self.max_body_bytes:
+                raise HttpError(413, f"PDF maior do que {self.max_body_bytes >> 20} MB")
+            body = await reader.readexactly(length)
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return method, url.path, query, body
+
+    async def extract(self, body, query):
+        output_format = query.get("format", "json")
+        mode = query.get("mode", "dict")
+        backend = query.get("backend", DEFAULT_BACKEND)
+        if output_format not in ("json", "xlsx"):
+            raise HttpError(400, "format tem de ser json ou xlsx")
+        if mode not in ("dict", "fast"):
+            raise HttpError(400, "mode tem de ser dict ou fast")
+        if backend not in BACKENDS:
+            raise HttpError(400, f"backend tem de ser {' ou '.join(BACKENDS)}")
+        if not body.startswith(b"%PDF"):
+            raise HttpError(400, "O corpo do pedido tem de ser um PDF")
+
+        # Um worker que morre (segfault do MuPDF, OOM) parte o pool: é recriado e o pedido repete uma vez num pool
+        # novo. Se o pool voltar a partir, o culpado é este PDF e o pedido falha (o pool fica outra vez recriado).
+        for attempt in range(2):
+            generation = self.generation
+            try:
+                result = await self.run_job(extract_items_bytes, body, output_format, mode, backend)
+                break
+            except BrokenProcessPool:
+                self.replace_executor(generation)
+                if attempt:
+                    raise HttpError(422, "O processo de extração terminou de forma inesperada com este PDF")
+
+        if "error" in result:
+            raise HttpError(422, result["error"])
+        self.served += 1
+        if output_format == "xlsx":
+            return 200, XLSX_CONTENT_TYPE, result["xlsx"]
+        return 200, "application/json", json.dumps(result, ensure_ascii=False).encode("utf-8")
+
+    async def run_job(self, fn, *args):
+        if self.slots.locked() and self.waiting >= self.max_queue:
+            raise HttpError(503, "Serviço ocupado, tente mais tarde")
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        try:
+            job = self.executor.submit(fn, *args)
+        except BaseException:
+            self.job_finished()
+            raise
+        # O lugar só é libertado quando o trabalho acaba no pool, não quando o pedido desiste (504):
+        # um trabalho que passou do tempo continua a ocupar um processo e tem de continuar a contar
+        job.add_done_callback(lambda _: self.release_from_pool(loop))
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)), self.timeout)
+        except asyncio.TimeoutError:
+            job.cancel()  # Só tem efeito se ainda não começou
+            raise HttpError(504, f"Extração demorou mais de {self.timeout}s")
+
+    def release_from_pool(self, loop):
+        # Corre num thread do pool: o semáforo é do loop, por isso a libertação é agendada lá
+        try:
+            loop.call_soon_threadsafe(self.job_finished)
+        except RuntimeError:
+            pass  # Loop já fechado (serviço a terminar)
+
+    def job_finished(self):
+        self.in_flight -= 1
+        self.slots.release()
+
+    def health(self):
+        return {
+            # degraded: um worker morreu e o pool só é recriado no próximo pedido
+            "status": "degraded" if self.pool_broken() else "ok",
+            "pool_generation": self.generation,
+            "workers": self.workers,
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "served": self.served,
+        }
+
+    async def route(self, method, path, query, body):
+        if path == "/health":
+            if method != "GET":
+                raise HttpError(405, "Use GET")
+            return 200, "application/json", json.dumps(self.health()).encode("utf-8")
+        if path == "/extract":
+            if method != "POST":
+                raise HttpError(405, "Use POST com o PDF no corpo")
+            return await self.extract(body, query)
+        raise HttpError(404, f"Caminho desconhecido: {path}")
+
+    async def handle_connection(self, reader, writer):
+        # Um pedido por ligação (Connection: close)
+        try:
+            try:
+                request = await self.read_request(reader)
+                if request is None:
+                    return
+                status, content_type, payload = await self.route(*request)
+            except HttpError as e:
+                status, content_type = e.status, "application/json"
+                payload = json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            except Exception as e:
+                status, content_type = 500, "application/json"
+                payload = json.dumps({"error": f"{type(e).__name__}: {e}"}, ensure_ascii=False).encode("utf-8")
+
+            writer.write(
+                f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+async def serve(service, host=HOST, port=PORT):
+    server = await service.start(host, port)
+    print(f"A servir em http://{host}:{port} (POST /extract, GET /health)")
+    async with server:
+        await server.serve_forever()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serviço HTTP local: recebe um PDF e devolve os itens em JSON (ou o xlsx).")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=2, help="Processos quentes para a extração")
+    parser.add_argument("--max-concurrent", type=int, help="PDFs em processamento ao mesmo tempo (por defeito: --workers)")
+    parser.add_argument("--max-queue", type=int, default=32, help="Pedidos à espera antes de responder 503")
+    parser.add_argument("--max-body-mb", type=int, default=MAX_BODY_MB, help="Tamanho máximo do PDF")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="Segundos máximos por extração (504)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    service = ExtractionService(workers=args.workers, max_concurrent=args.max_concurrent, max_queue=args.max_queue,
+                                max_body_bytes=args.max_body_mb << 20, timeout=args.timeout)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
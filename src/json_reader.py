@@ -1,67 +1,87 @@
 import os
 import re
+import sys
 import json
+import argparse
 import string
 import unicodedata
-import pandas as pd
-from collections import defaultdict
+import numpy as np
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
 
-
-import pandas as pd
-import json
-from collections import defaultdict
-
-try:
-    import fitz  # PyMuPDF
-except ImportError:
-    fitz = None
+from word_store import WordStore, WordStoreBuilder
+from wordbin import WordBinReader, is_wordbin
+from layout_templates import LAYOUTS_PATH, LayoutTemplates, layout_fingerprint
+from processed_store import file_sha256
+from result_writer import OUTPUT_FORMATS, ConsolidatedWriter, output_path, write_items
+from profiling import add_profile_arguments, enable_from_args, profile_document, current as current_profile
 
 #------------------------------------------------------------------------------------------------------------------------------------
 #--------------------------------------------------------Global-Helpers--------------------------------------------------------------
 
 QUANTITY_KEYWORDS = ["quantidade", "qtd", "qt", "quantity", "q"]
 
+# Versão do extrator de itens: aumentar quando o resultado de extract_items_json mudar (invalida a cache de itens)
+EXTRACTOR_VERSION = 1
+
+QUANTITY_PATTERN = re.compile(r"[-+]?\d*[\.,]?\d+")
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+# Número de textos distintos guardados em cache ("UN", "PCS", "1,00", ... repetem-se milhares de vezes)
+TOKEN_CACHE_SIZE = 1 << 16
+
+# O núcleo de extração só precisa de numpy: sem pandas nem fitz, o import fica rápido (ver "python benchmark.py imports")
+def is_missing(value):
+    # O que pd.isna considerava vazio para um texto: None ou NaN
+    return value is None or (isinstance(value, float) and value != value)
+
 def normalize_info(text):
-    if pd.isna(text):
+    if is_missing(text):
         return ""
     text = str(text).strip().lower()
-    # Remove acentuação
-    text = ''.join(
-        c for c in unicodedata.normalize('NFD', text)
-        if unicodedata.category(c) != 'Mn'
-    )
+    # Remove acentuação (texto só ASCII não tem acentos a remover)
+    if not text.isascii():
+        text = ''.join(
+            c for c in unicodedata.normalize('NFD', text)
+            if unicodedata.category(c) != 'Mn'
+        )
     # Remove pontuação (.,:;- etc.)
-    text = ''.join(c for c in text if c not in string.punctuation)
-    return text
+    return text.translate(PUNCTUATION_TABLE)
 
 def normalize_quantity(q):
     try:
         return str(int(float(str(q).replace(",", ".").strip())))
-    except:
+    except (ValueError, OverflowError):
         return str(q).strip()
 
 def is_quantity_number(text):
+    t = str(text).replace(",", ".").strip()
+    match = QUANTITY_PATTERN.search(t)
+    if match is None:
+        return False
     try:
-        t = str(text).replace(",", ".").strip()
-        float(re.findall(r"[-+]?\d*[\.,]?\d+", t)[0])
+        float(match.group())
         return True
-    except:
+    except ValueError:
         return False
 
-def sort_items_by_key(items, *keys, default=0):
-    return sorted(
-        items,
-        key=lambda item: tuple(item.get(k, default) for k in keys)
-    )
+NORMALIZED_KEYWORDS = frozenset(normalize_info(k) for k in QUANTITY_KEYWORDS)
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def classify_token(text):
+    # Tudo o que o extrator precisa de saber sobre um texto, calculado uma única vez:
+    # (texto normalizado, é palavra-chave de quantidade, é número, quantidade normalizada)
+    normalized = normalize_info(text)
+    return normalized, normalized in NORMALIZED_KEYWORDS, is_quantity_number(text), normalize_quantity(text)
 
-def join_line_texts(words, filter_set=None):
+def join_line_texts(store, indices, filter_set=None):
+    stripped = store.stripped
     return " ".join(
-        word["text"].strip()
-        for word in words
-        if word["text"].strip() and (filter_set is None or word["text"].strip() in filter_set)
+        text
+        for text in (stripped[t] for t in store.text_ids[indices])
+        if text and (filter_set is None or text in filter_set)
     )
 
-def filter_new_words_ordered(words_sorted, *texts_to_exclude):
+def filter_new_words_ordered(store, indices_sorted, *texts_to_exclude):
     exclude_words = []
     for txt in texts_to_exclude:
         exclude_words += txt.split()
@@ -71,332 +91,501 @@ def filter_new_words_ordered(words_sorted, *texts_to_exclude):
         exclude_counter[w] = exclude_counter.get(w, 0) + 1
 
     result = []
-    for w in words_sorted:
-        txt = w["text"].strip()
+    for i, text_id in zip(indices_sorted, store.text_ids[indices_sorted]):
+        txt = store.stripped[text_id]
         if not txt:
             continue
         count = exclude_counter.get(txt, 0)
         if count > 0:
             exclude_counter[txt] -= 1
         else:
-            result.append(w)
-    return result
+            result.append(i)
+    return np.array(result, dtype=np.int64)
+
+def concat_lines(lines, ys):
+    if not len(ys):
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([lines[yy] for yy in ys])
+
+# Largura (em pontos) das células do índice espacial; uma palavra normal ocupa 1 ou 2 células
+GRID_CELL_WIDTH = 32
+
+# Índice espacial de uma página: células de largura fixa em x, e cada palavra entra em todas as células que o seu
+# intervalo inteiro [x_start, x_end] toca (os mesmos que set(range(x_start, x_end + 1))). Dentro de cada célula as
+# entradas ficam ordenadas por y, por isso "palavras que intersetam [x0, x1] abaixo de y" só visita as células da
+# região e, em cada uma, as entradas abaixo de y: o custo depende do tamanho do resultado e não da página.
+class WordGrid:
+    def __init__(self, x_starts, x_ends, ys, cell_width=GRID_CELL_WIDTH):
+        self.x_starts = np.asarray(x_starts, dtype=np.int64)
+        self.x_ends = np.asarray(x_ends, dtype=np.int64)
+        ys = np.asarray(ys)
+        self.cell_width = cell_width
+
+        keep = np.flatnonzero(self.x_ends >= self.x_starts)  # Intervalo vazio nunca interseta
+        first_cell = self.x_starts[keep] // cell_width
+        spans = self.x_ends[keep] // cell_width - first_cell + 1
+        positions = np.repeat(keep, spans)
+        offsets = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+        cells = np.repeat(first_cell, spans) + offsets
+
+        self.min_cell = int(cells.min()) if len(cells) else 0
+        cells -= self.min_cell
+        entry_order = np.lexsort((ys[positions], cells))
+        self.entries = positions[entry_order]
+        self.entry_ys = ys[positions][entry_order]
+        self.cell_count = int(cells.max()) + 1 if len(cells) else 0
+        self.cell_bounds = np.searchsorted(cells[entry_order], np.arange(self.cell_count + 1))
+
+    def query(self, x0, x1, y_min=None):
+        # Posições (na página) das palavras que intersetam [x0, x1] e, se indicado, com y > y_min
+        first = max(int(x0) // self.cell_width - self.min_cell, 0)
+        last = min(int(x1) // self.cell_width - self.min_cell, self.cell_count - 1)
+        if x1 < x0 or first > last:
+            return np.empty(0, dtype=np.int64)
+        parts = []
+        for cell in range(first, last + 1):
+            a, b = self.cell_bounds[cell], self.cell_bounds[cell + 1]
+            if y_min is not None:
+                a += np.searchsorted(self.entry_ys[a:b], y_min, side="right")
+            parts.append(self.entries[a:b])
+        # Uma palavra que ocupa várias células aparece uma vez em cada
+        candidates = parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts))
+        return candidates[(self.x_starts[candidates] <= x1) & (self.x_ends[candidates] >= x0)]
 
 #------------------------------------------------------------------------------------------------------------------------------------
 #----------------------------------------------------------------JSON----------------------------------------------------------------
 
-def extract_items_json(pages, y_margin_possible_values=None):
-    y_margin_line_values = 5
-    header_names = []
-    header_cord = []
-    all_words = []
-    json_items = []
-    fallback_items = []
-    normalized_keywords = [normalize_info(k) for k in QUANTITY_KEYWORDS]
-
-    # -----------------------------------------------------------------------------------------------
-    # ------------------------------------- Guardar Info Headers ------------------------------------
-
-    # Junta a deteção do cabeçalho e a cópia das palavras com número da página
-    for page_num, page in enumerate(pages, 1):
-        for word in page["words"]:
-            word_copy = dict(word)
-            word_copy["page"] = page_num
-            all_words.append(word_copy)
-
-            if normalize_info(word["text"]) in normalized_keywords:
-                header_names.append(word["text"])
-                header_cord.append({"x": word["x"],
-                                    "y": word["y"],
-                                    "width": word.get("width", 0),
-                                    "page": page_num,
-                                    "text": word["text"]
-                                    })
-
-    # -----------------------------------------------------------------------------------------------
-    # ---------------------------------------- Organizar Valores ------------------------------------
-
-    # Agrupar palavras por página e coordenada y (linha)
-    lines_by_page = defaultdict(lambda: defaultdict(list))
-    for word in all_words:
-        lines_by_page[word["page"]][int(round(word["y"]))].append(word)
-
-    header_cord_by_page = defaultdict(list)
-    for qc in header_cord:
-        header_cord_by_page[qc["page"]].append((qc["x"], qc["y"]))
-
-    for page in sorted(lines_by_page):
-        qty_lines = []
-        last_possible_values = ""
-        lines = lines_by_page[page]
-        found_valid_quantity = False
-        y_sorted = sorted(lines.keys())
+# Extração página a página: o estado que passa de uma página para a seguinte (largura de referência das
+# quantidades e a última linha do fallback) fica no objeto, por isso as páginas podem chegar uma de cada vez.
+# Com layouts (LayoutTemplates) as páginas cujo cabeçalho já foi visto usam as colunas guardadas.
+class ItemExtractor:
+    def __init__(self, y_margin_possible_values=None, layouts=None):
+        self.y_margin_possible_values = y_margin_possible_values
+        self.layouts = layouts
+        self.y_margin_line_values = 5
+        self.json_items = []
+        self.fallback_items = []
+        self.delta_x = None
+        self.first_y = None
+        self.last_y = None
+        self.no_line_values = None
+
+    def items(self):
+        if self.json_items:
+            return self.json_items
+        else:
+            return self.fallback_items
+
+    def add_store(self, store):
+        y_margin_possible_values = self.y_margin_possible_values
+        y_margin_line_values = self.y_margin_line_values
+        json_items = self.json_items
+        fallback_items = self.fallback_items
+        profile = current_profile()
+        profile.mark()
 
         # -----------------------------------------------------------------------------------------------
-        # -------------------------------------- Guardar Coordenadas ------------------------------------
+        # ------------------------------------- Guardar Info Headers ------------------------------------
 
-        headers_coords = [qc for qc in header_cord if qc["page"] == page]
+        # Classifica cada texto distinto uma única vez (com cache entre páginas e documentos)
+        store.classify(classify_token)
+        is_keyword = store.is_keyword
+        is_quantity = store.is_quantity
+        profile.lap("classify")
 
         # -----------------------------------------------------------------------------------------------
-        # ------------------------------------- Procura y dos Valores -----------------------------------
-
-        # Encontrar todas as linhas que têm quantidades (nova abordagem)
-        for y in y_sorted:
-            words_in_line = lines[y]
-            matching_words = []
-
-            header_ranges = []
-            for c in headers_coords:
-                x_start = int(round(c["x"]))
-                x_end = int(round(c["x"] + c.get("width", 0)))
-                y_value = c["y"]
-
-                header_ranges.append({
-                    "x_range": set(range(x_start, x_end + 1)),
-                    "y": y_value,
-                    "text": c.get("text", "")
-                })
-
-            for word in words_in_line:
-                word_x_range = set(range(
-                    int(round(word["x"])),
-                    int(round(word["x"] + word.get("width", 0))) + 1
-                ))
-                word_y = word["y"]
-
-                for header in header_ranges:
-                    if word_x_range & header["x_range"] and word_y > header["y"]:
-                        if is_quantity_number(word["text"]):
-                            matching_words.append(word)
-                            break
-
-            if matching_words:
-                qty_lines.append(y)
-
-        # Se não encontrou nenhuma linha de quantidade, faz fallback para todas as palavras do cabeçalho
-        if not found_valid_quantity and headers_coords:
-            # Tenta encontrar o y mais próximo da linha do cabeçalho
-            header_y_raw = headers_coords[0]["y"]
-            header_y = min(lines, key=lambda ly: abs(ly - header_y_raw))
-
-            header_line_words = sort_items_by_key(lines[header_y], "x")
-            header_cols = []
-            for header_word in header_line_words:
-                col_x = int(round(header_word["x"]))
-                col_width = int(round(header_word.get("width", 0)))
-                col_x_range = set(range(col_x, col_x + col_width + 1))
-                header_cols.append({
-                    "text": header_word["text"],
-                    "x_range": col_x_range,
-                    "y": header_word["y"]
-                })
-
-            for y in y_sorted:
-                if y <= header_y:
-                    continue
-                found_cols = []
-                for col in header_cols:
-                    for word in lines[y]:
-                        word_x = int(round(word["x"]))
-                        word_width = int(round(word.get("width", 0)))
-                        word_x_range = set(range(word_x, word_x + word_width + 1))
-                        if word_x_range & col["x_range"]:
-                            found_cols.append(col["text"])
-                            break
-
-                # Permite margem mínima: se pelo menos 2 colunas diferentes foram identificadas
-                if len(set(found_cols)) >= 2:
-                    # Controle de distância entre linhas
-                    if 'last_y' not in locals():
-                        # Primeiro valor após cabeçalho
-                        first_y = y
-                        last_y = y
-                        line_words_sorted = sort_items_by_key(lines[y], "x")
-                        no_line_values = join_line_texts(line_words_sorted)
-                        no_target_quantity = "Não Identificado"
-                        fallback_items.append({
-                            "Quantity":  no_target_quantity,
-                            "All Values": no_line_values,
-                            "page": page,
-                            "y": y,
-                        })
-                    else:
-                        # Para os próximos valores, aplica o filtro de distância
-                        dist_cabecalho_primeiro = abs(first_y - header_y)
-                        dist_entre_valores = abs(y - last_y)
-                        if dist_entre_valores < 2 * dist_cabecalho_primeiro:
-                            last_y = y
-                            line_words_sorted = sort_items_by_key(lines[y], "x")
-                            line_values = join_line_texts(line_words_sorted)
+        # ---------------------------------------- Organizar Valores ------------------------------------
+
+        # Linha (y arredondado) e intervalos inteiros em x de todas as palavras, de uma vez
+        line_y = np.rint(store.y).astype(np.int64)
+        x_start = np.rint(store.x).astype(np.int64)
+        x_end = np.rint(store.x + store.width).astype(np.int64)
+        x_end_cols = x_start + np.rint(store.width).astype(np.int64)
+        right_edge = store.x + store.width
+
+        for page, start, end in store.page_ranges():
+            qty_lines = []
+            last_possible_values = ""
+            found_valid_quantity = False
+
+            # Agrupar palavras da página por coordenada y (linha), cada linha já ordenada por x
+            order = np.lexsort((store.x[start:end], line_y[start:end])) + start
+            keys_sorted = line_y[order]
+            boundaries = np.flatnonzero(np.diff(keys_sorted)) + 1
+            line_starts = np.concatenate(([0], boundaries))
+            y_sorted = keys_sorted[line_starts].tolist()
+            lines = dict(zip(y_sorted, np.split(order, boundaries)))
+            # Posição da primeira palavra de cada linha (ordem em que as linhas aparecem no documento)
+            line_first_word = np.minimum.reduceat(order, line_starts)
+
+            # -----------------------------------------------------------------------------------------------
+            # -------------------------------------- Guardar Coordenadas ------------------------------------
+
+            headers_coords = start + np.flatnonzero(is_keyword[start:end])
+
+            # Cabeçalho já visto noutra página/documento: colunas e delta_x vêm do modelo
+            fingerprint = None
+            template = None
+            if self.layouts is not None and len(headers_coords):
+                fingerprint = layout_fingerprint(store, headers_coords, line_y, lines)
+                template = self.layouts.get(fingerprint)
+                profile.count("layout_hits" if template is not None else "layout_misses")
+
+            # -----------------------------------------------------------------------------------------------
+            # ------------------------------------- Procura y dos Valores -----------------------------------
+
+            # Palavras que estão por baixo de alguma coluna de quantidade (interseção em X e abaixo em Y)
+            under_header = np.zeros(end - start, dtype=bool)
+            if template is not None:
+                # Poucas colunas conhecidas: teste direto sobre as palavras da página, sem construir o índice
+                page_x_start, page_x_end, page_y = x_start[start:end], x_end[start:end], store.y[start:end]
+                for column_start, column_end, header_y in template["columns"]:
+                    if column_start <= column_end:
+                        under_header |= (page_x_start <= column_end) & (page_x_end >= column_start) & (page_y > header_y)
+                page_delta_x = template["delta_x"]
+            else:
+                # Índice espacial das palavras da página, construído uma vez
+                word_grid = WordGrid(x_start[start:end], x_end[start:end], store.y[start:end])
+                for header in headers_coords:
+                    under_header[word_grid.query(x_start[header], x_end[header], store.y[header])] = True
+
+                # Largura máxima de uma quantidade: distância entre os vizinhos do penúltimo valor da linha do
+                # cabeçalho (a última linha de cabeçalho com 3+ palavras ganha)
+                page_delta_x = None
+                for header in headers_coords:
+                    header_line_words = lines[int(line_y[header])]
+                    if len(header_line_words) >= 3:
+                        page_delta_x = float(right_edge[header_line_words[-1]] - right_edge[header_line_words[-3]])
+                if fingerprint is not None:
+                    columns = [[int(x_start[h]), int(x_end[h]), float(store.y[h])] for h in headers_coords]
+                    self.layouts.put(fingerprint, columns, page_delta_x)
+
+            # Encontrar todas as linhas que têm quantidades (nova abordagem)
+            qty_lines = np.unique(line_y[start:end][under_header & is_quantity[start:end]]).tolist()
+            profile.lap("header_detection")
+            profile.count("pages")
+            profile.count("words", end - start)
+            profile.count("lines", len(y_sorted))
+            profile.count("quantity_lines", len(qty_lines))
+            fallback_before = len(fallback_items)
+
+            # Se não encontrou nenhuma linha de quantidade, faz fallback para todas as palavras do cabeçalho
+            if not found_valid_quantity and len(headers_coords):
+                # Tenta encontrar o y mais próximo da linha do cabeçalho (em empate, a linha que aparece primeiro)
+                header_y_raw = store.y[headers_coords[0]]
+                distances = np.abs(np.array(y_sorted) - header_y_raw)
+                closest = np.flatnonzero(distances == distances.min())
+                header_y = y_sorted[closest[np.argmin(line_first_word[closest])]]
+
+                header_line_words = lines[header_y]
+
+                # Conta, por linha abaixo do cabeçalho, quantas colunas (textos diferentes) têm alguma palavra por baixo.
+                # As colunas do fallback usam x_start + largura como fim, por isso têm o seu próprio índice (y = linha)
+                column_grid = WordGrid(x_start[start:end], x_end_cols[start:end], line_y[start:end])
+                word_line = np.empty(end - start, dtype=np.int64)
+                word_line[order - start] = np.repeat(np.arange(len(y_sorted)), np.diff(np.append(line_starts, len(order))))
+                hit_keys = [
+                    word_line[column_grid.query(x_start[word], x_end_cols[word], header_y)] * len(store.texts) + store.text_ids[word]
+                    for word in header_line_words
+                ]
+                hit_lines = np.unique(np.concatenate(hit_keys)) // len(store.texts) if hit_keys else np.empty(0, dtype=np.int64)
+                found_cols_by_line = np.bincount(hit_lines, minlength=len(y_sorted))
+
+                for line_pos, y in enumerate(y_sorted):
+                    if y <= header_y:
+                        continue
+
+                    # Permite margem mínima: se pelo menos 2 colunas diferentes foram identificadas
+                    if found_cols_by_line[line_pos] >= 2:
+                        # Controle de distância entre linhas
+                        if self.last_y is None:
+                            # Primeiro valor após cabeçalho
+                            self.first_y = y
+                            self.last_y = y
+                            self.no_line_values = join_line_texts(store, lines[y])
                             no_target_quantity = "Não Identificado"
                             fallback_items.append({
                                 "Quantity":  no_target_quantity,
-                                "All Values": no_line_values,
+                                "All Values": self.no_line_values,
                                 "page": page,
                                 "y": y,
                             })
+                        else:
+                            # Para os próximos valores, aplica o filtro de distância
+                            dist_cabecalho_primeiro = abs(self.first_y - header_y)
+                            dist_entre_valores = abs(y - self.last_y)
+                            if dist_entre_valores < 2 * dist_cabecalho_primeiro:
+                                self.last_y = y
+                                line_values = join_line_texts(store, lines[y])
+                                no_target_quantity = "Não Identificado"
+                                fallback_items.append({
+                                    "Quantity":  no_target_quantity,
+                                    "All Values": self.no_line_values,
+                                    "page": page,
+                                    "y": y,
+                                })
+            profile.count("fallback_lines", len(fallback_items) - fallback_before)
+            profile.lap("fallback")
         
-        # -----------------------------------------------------------------------------------------------
-        # ----------------------------------------- Define Margens --------------------------------------
-
-        # Calcular Media da Distancia entre Valores
-        if y_margin_possible_values is None:
-            if len(qty_lines) > 1:
-                diffs = [qty_lines[i+1] - qty_lines[i] for i in range(len(qty_lines)-1)]
-                y_margin_possible_values_page = int(sum(diffs) / len(diffs))
-            else:
-                y_margin_possible_values_page = 30  # valor padrão
-        else:
-            y_margin_possible_values_page = y_margin_possible_values
-        
-        # -----------------------------------------------------------------------------------------------
-
-        # Para cada quantidade, apanha a linha + as N linhas abaixo, sem apanhar a próxima quantidade
-        for idx, y in enumerate(qty_lines):
-            line_words = []
-            possible_value_words = []
-            block_lines = []
-            header_ranges = []
-            matching_words = []
-
             # -----------------------------------------------------------------------------------------------
-            # ---------------------------------- Range para Recolha de Info ---------------------------------
-
-            # Descobre até onde pode apanhar (sem incluir próxima quantidade)
-            if idx + 1 < len(qty_lines):
-                next_qty_y = qty_lines[idx + 1]
-                valid_correct_ys = [yy for yy in y_sorted if y < yy < next_qty_y and (yy - y) <= y_margin_possible_values_page]
-                block_ys = [yy for yy in y_sorted if y <= yy < next_qty_y]
+            # ----------------------------------------- Define Margens --------------------------------------
+
+            # Calcular Media da Distancia entre Valores
+            if y_margin_possible_values is None:
+                if len(qty_lines) > 1:
+                    diffs = [qty_lines[i+1] - qty_lines[i] for i in range(len(qty_lines)-1)]
+                    y_margin_possible_values_page = int(sum(diffs) / len(diffs))
+                else:
+                    y_margin_possible_values_page = 30  # valor padrão
             else:
-                valid_correct_ys = [yy for yy in y_sorted if yy > y and (yy - y) <= y_margin_possible_values_page]
-                block_ys = [yy for yy in y_sorted if yy >= y]
-
-            # -----------------------------------------------------------------------------------------------
-            # -------------------------------------- Linhas dos Valores -------------------------------------
-
-            # Adiciona margem em y para capturar mais informação em line_values
-            line_ys = [yy for yy in y_sorted if abs(yy - y) <= y_margin_line_values]
-            
-            for yy in line_ys:
-                line_words.extend(lines[yy])
-            line_words_sorted = sort_items_by_key(line_words, "x")
-            line_values = join_line_texts(line_words_sorted)
-
+                y_margin_possible_values_page = y_margin_possible_values
 
             # -----------------------------------------------------------------------------------------------
             # ---------------------------------- Identificação de Limites -----------------------------------
 
-            for header in headers_coords:
-                header_y = int(round(header["y"]))
-                if header_y in lines:
-                    header_line_words = sort_items_by_key(lines[header_y], "x")
-                    for i, word in enumerate(header_line_words):
-                        left = header_line_words[i-1] if i > 0 else None
-                        right = header_line_words[i+1] if i < len(header_line_words)-1 else None
-                        left_xw = left["x"] + left.get("width", 0) if left else None
-                        right_xw = right["x"] + right.get("width", 0) if right else None
+            # A largura de referência só muda em páginas com quantidades (igual para todas as quantidades da página)
+            if qty_lines and page_delta_x is not None:
+                self.delta_x = page_delta_x
 
-                        if left_xw is not None and right_xw is not None:
-                            delta_x = right_xw - left_xw
-
-            
             # -----------------------------------------------------------------------------------------------
-            # --------------------------------------- Possíveis Valores -------------------------------------
-
-            # Junta todas as linhas dentro da margem vertical
-            for yy in valid_correct_ys:
-                possible_value_words.extend(lines[yy])
-            possible_value_words_sorted = sort_items_by_key(possible_value_words, "x")
-            all_text = join_line_texts(possible_value_words_sorted)
-
-            # Filtra palavras já vistas
-            filtered_words = filter_new_words_ordered(possible_value_words_sorted, line_values, last_possible_values)
-            possible_values = join_line_texts(filtered_words)
 
-            # Só atualiza o histórico se possível_values tiver conteúdo
-            if possible_values.strip():
-                last_possible_values = all_text
+            # Para cada quantidade, apanha a linha + as N linhas abaixo, sem apanhar a próxima quantidade
+            for idx, y in enumerate(qty_lines):
+
+                # -----------------------------------------------------------------------------------------------
+                # ---------------------------------- Range para Recolha de Info ---------------------------------
+
+                # Descobre até onde pode apanhar (sem incluir próxima quantidade)
+                # y_sorted já está ordenado: as janelas são fatias encontradas por pesquisa binária
+                y_index = bisect_left(y_sorted, y)
+                margin_end = bisect_right(y_sorted, y + y_margin_possible_values_page)
+                if idx + 1 < len(qty_lines):
+                    next_qty_index = bisect_left(y_sorted, qty_lines[idx + 1])
+                    valid_correct_ys = y_sorted[y_index + 1:min(next_qty_index, margin_end)]
+                    block_ys = y_sorted[y_index:next_qty_index]
+                else:
+                    valid_correct_ys = y_sorted[y_index + 1:margin_end]
+                    block_ys = y_sorted[y_index:]
+
+                # -----------------------------------------------------------------------------------------------
+                # -------------------------------------- Linhas dos Valores -------------------------------------
+
+                # Adiciona margem em y para capturar mais informação em line_values
+                line_ys = y_sorted[bisect_left(y_sorted, y - y_margin_line_values):bisect_right(y_sorted, y + y_margin_line_values)]
+
+                line_words_sorted = store.sort_by_x(concat_lines(lines, line_ys))
+                line_values = join_line_texts(store, line_words_sorted)
+
+                # -----------------------------------------------------------------------------------------------
+                # --------------------------------------- Possíveis Valores -------------------------------------
+
+                # Junta todas as linhas dentro da margem vertical
+                possible_value_words_sorted = store.sort_by_x(concat_lines(lines, valid_correct_ys))
+                all_text = join_line_texts(store, possible_value_words_sorted)
+
+                # Filtra palavras já vistas
+                filtered_words = filter_new_words_ordered(store, possible_value_words_sorted, line_values, last_possible_values)
+                possible_values = join_line_texts(store, filtered_words)
+
+                # Só atualiza o histórico se possível_values tiver conteúdo
+                if possible_values.strip():
+                    last_possible_values = all_text
+
+                # -----------------------------------------------------------------------------------------------
+                # ------------------------------------- Quantidades-Valores -------------------------------------
+
+                # Palavras da linha por baixo de uma coluna de quantidade, por y (empates pela ordem do documento)
+                matching_words = lines[y][under_header[lines[y] - start]]
+                matching_words = matching_words[np.lexsort((matching_words, store.y[matching_words]))]
+                if len(matching_words) and self.delta_x is None:
+                    # Sem nenhuma linha de cabeçalho com 3+ palavras não há largura de referência (como sempre foi)
+                    raise NameError("delta_x não definido: nenhuma linha de cabeçalho com pelo menos 3 palavras")
+                target_quantities = [
+                    store.quantity_texts[store.text_ids[i]]
+                    for i in matching_words
+                    if store.width[i] < self.delta_x
+                ]
+                target_quantity = " ".join(target_quantities)
+
+                # -----------------------------------------------------------------------------------------------
+                # ------------------------------------ Todos os Valores Sumados ---------------------------------
+            
+                all_words_sorted = store.sort_by_x(np.concatenate((line_words_sorted, filtered_words)))
+                all_values = join_line_texts(store, all_words_sorted)
+
+                # -----------------------------------------------------------------------------------------------
+                # ---------------------------------- Todos os Valores 100% do PDF -------------------------------
+
+                block_lines = store.sort_by_x(concat_lines(lines, block_ys))
+                full_content = join_line_texts(store, block_lines)
+
+                # -----------------------------------------------------------------------------------------------
+                # ----------------------------------------- Guarda Valores ---------------------------------------
+
+                # Guarda o item
+                if target_quantity.strip():
+                    found_valid_quantity = True
+                    json_items.append({
+                        "Quantity": target_quantity,
+                        "All Values": all_values,
+                        "page": page,
+                        "y": y,
+                    })
+            profile.lap("quantity_scan")
+
+
+def record_items(extractor):
+    items = extractor.items()
+    profile = current_profile()
+    profile.count("items", len(items))
+    profile.set("fallback_used", bool(items) and not extractor.json_items)
+    return items
+
+def extract_items_json(pages, y_margin_possible_values=None, layouts=None):
+    with current_profile().stage("build_store"):
+        store = pages if isinstance(pages, WordStore) else WordStore.from_pages(pages)
+    extractor = ItemExtractor(y_margin_possible_values, layouts)
+    extractor.add_store(store)
+    return record_items(extractor)
+
+def extract_items_streaming(page_stores, y_margin_possible_values=None, layouts=None):
+    # Recebe uma WordStore por página (ver iter_page_stores): a memória fica limitada pela maior página
+    extractor = ItemExtractor(y_margin_possible_values, layouts)
+    profile = current_profile()
+    profile.mark()
+    for store in page_stores:
+        profile.lap("load_words")
+        extractor.add_store(store)
+    return record_items(extractor)
 
-            # -----------------------------------------------------------------------------------------------
-            # ------------------------------------- Quantidades-Valores -------------------------------------
-
-            for c in headers_coords:
-                x_start = int(round(c["x"]))
-                x_end = int(round(c["x"] + c.get("width", 0)))
-                y_value = c["y"]
-
-                header_ranges.append({
-                    "x_range": set(range(x_start, x_end + 1)),
-                    "y": y_value,
-                    "text": c.get("text", "")
-                })
-
-            for word in lines[y]:
-                word_x_range = set(range(
-                    int(round(word["x"])),
-                    int(round(word["x"] + word.get("width", 0))) + 1
-                ))
-                word_y = word["y"]
-
-                for header in header_ranges:
-                    # Verifica se há intersecção no X E se está abaixo no Y
-                    if word_x_range & header["x_range"] and word_y > header["y"]:
-                        matching_words.append(word)
-                        break  # Já pertence a um header, não precisa testar os outros
-
-            matching_words = sort_items_by_key(matching_words, "y")
-            target_quantities = [
-                normalize_quantity(word["text"])
-                for word in matching_words
-                if word.get("width", 0) < delta_x
-            ]
-            target_quantity = " ".join(target_quantities)
+#----------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Documento--------------------------------------------------------------
+
+def load_pages(json_path):
+    # Aceita o JSON de palavras ou o formato binário .wbin (lido diretamente para a WordStore)
+    if is_wordbin(json_path):
+        with WordBinReader(json_path) as reader:
+            return reader.read_store()
+    with open(json_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def iter_json_pages(json_path, chunk_size=1 << 16):
+    # Lê a lista de páginas do JSON objeto a objeto, sem carregar o ficheiro inteiro
+    decoder = json.JSONDecoder()
+    with open(json_path, encoding="utf-8") as f:
+        buffer = f.read(chunk_size)
+        pos = 0
+        eof = not buffer
+        opened = False
+        while True:
+            # Salta espaços, '[' inicial e vírgulas; lê mais texto quando o buffer acaba
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == "," or (not opened and buffer[pos] == "[")):
+                opened = opened or buffer[pos] == "["
+                pos += 1
+            if pos >= len(buffer):
+                if eof:
+                    raise ValueError(f"JSON incompleto: {json_path}")
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            if not opened:
+                raise ValueError(f"Era esperada uma lista de páginas: {json_path}")
+            if buffer[pos] == "]":
+                return
+            try:
+                page, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Página maior do que o buffer: lê pelo menos outro tanto (custo linear, não quadrático)
+                chunk = f.read(max(chunk_size, len(buffer) - pos))
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield page
+            buffer, pos = buffer[end:], 0
+
+def iter_page_stores(json_path):
+    # Uma WordStore por página, numerada pela posição no ficheiro
+    if is_wordbin(json_path):
+        with WordBinReader(json_path) as reader:
+            for index in range(len(reader)):
+                yield reader.read_store([index])
+        return
+    for page_num, page in enumerate(iter_json_pages(json_path), 1):
+        builder = WordStoreBuilder()
+        builder.add_words(page_num, page["words"])
+        yield builder.build()
+
+def process_json_file(json_path, result_folder, stream=False, output_format="xlsx", consolidated=None, layouts=None):
+    # Com consolidated (ConsolidatedWriter) os itens são acrescentados ao resultado único do lote
+    with profile_document(json_path) as profile:
+        if stream:
+            json_items = extract_items_streaming(iter_page_stores(json_path), layouts=layouts)
+        else:
+            with profile.stage("load_words"):
+                pages = load_pages(json_path)
+            json_items = extract_items_json(pages, layouts=layouts)
+
+        with profile.stage("write_results"):
+            if consolidated is not None:
+                consolidated.write_document(os.path.basename(json_path), json_items)
+                return consolidated.out_path
+            base_name = os.path.splitext(os.path.basename(json_path))[0]
+            out_path = output_path(result_folder, base_name, output_format)
+            write_items(json_items, out_path, output_format)
+        return out_path
 
-            # -----------------------------------------------------------------------------------------------
-            # ------------------------------------ Todos os Valores Sumados ---------------------------------
-            
-            all_words_combined = line_words_sorted + filtered_words
-            all_words_sorted = sort_items_by_key(all_words_combined, "x")
-            all_values = join_line_texts(all_words_sorted)
+def write_items_excel(json_items, excel_out_path):
+    # Linhas escritas diretamente no xlsxwriter em modo constant_memory (sem DataFrame); ver result_writer.py
+    write_items(json_items, excel_out_path, "xlsx")
 
-            # -----------------------------------------------------------------------------------------------
-            # ---------------------------------- Todos os Valores 100% do PDF -------------------------------
+#----------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Manifest---------------------------------------------------------------
 
-            for yy in block_ys:
-                block_lines.extend(lines[yy])
-            block_lines = sort_items_by_key(block_lines, "x")
-            full_content = join_line_texts(block_lines)
+MANIFEST_NAME = ".manifest.json"
 
-            # -----------------------------------------------------------------------------------------------
-            # ----------------------------------------- Guarda Valores ---------------------------------------
-
-            # Guarda o item
-            if target_quantity.strip():
-                found_valid_quantity = True
-                json_items.append({
-                    "Quantity": target_quantity,
-                    "All Values": all_values,
-                    "page": page,
-                    "y": y,
-                })
-
-    if json_items:
-        return json_items
-    else:
-        return fallback_items
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"Manifest inválido, a reprocessar tudo: {manifest_path}")
+        return {}
+
+def save_manifest(manifest_path, manifest):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def is_up_to_date(entry, json_path, stat):
+    if not entry or not os.path.exists(entry.get("output", "")):
+        return False
+    # mtime e tamanho iguais: não é preciso ler o ficheiro
+    if entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size:
+        return True
+    # mtime mudou (ex: cópia), mas o conteúdo pode ser o mesmo
+    if entry.get("sha256") == file_sha256(json_path):
+        entry["mtime"] = stat.st_mtime
+        entry["size"] = stat.st_size
+        return True
+    return False
 
 #----------------------------------------------------------------------------------------------------------------------------------
 #-------------------------------------------------------------Main-----------------------------------------------------------------
-def main():
+def main(force=False, stream=False, output_format="xlsx", layouts=None):
     #------------------------------------------------------------------------
     # ------------------------------- 3. JSON -------------------------------
 
     jsons_folder = "../jsons"
-    result_folder = os.path.join("..", "result")
     if not os.path.exists(jsons_folder):
         print("Pasta JSONs não encontrada.")
         return
-    json_files = [f for f in os.listdir(jsons_folder) if f.endswith('.json')]
+    json_files = [f for f in os.listdir(jsons_folder) if f.endswith('.json') or is_wordbin(f)]
     if not json_files:
         print("Nenhum ficheiro JSON encontrado na pasta.")
         return
@@ -405,77 +594,132 @@ def main():
     result_folder = os.path.join("..", "result")
     os.makedirs(result_folder, exist_ok=True)
 
+    manifest_path = os.path.join(result_folder, MANIFEST_NAME)
+    manifest = {} if force else load_manifest(manifest_path)
+    # Remove entradas de JSONs que já não existem
+    manifest = {name: entry for name, entry in manifest.items() if name in json_files}
+
     #------------------------------------------------------------------------
     # ------------------------ Ciclo de Processamento -----------------------
 
-    for json_file in json_files:
-        try:
-            json_path = os.path.join(jsons_folder, json_file)
-            json_items = []
-            if os.path.exists(json_path):
-                with open(json_path, encoding="utf-8") as f:
-                    pages = json.load(f)
-                json_items = extract_items_json(pages)
-            else:
-                print(f"JSON não encontrado: {json_path}")
-                continue
-
-            base_name = os.path.splitext(os.path.basename(json_path))[0]
-            excel_out_path = os.path.join(result_folder, f"{base_name}.xlsx")
-
-            #-----------------------------------------------------------------------
-            #------------------------------ Items Value ----------------------------
-           
-            total_items = len(json_items)
-            items_by_page = defaultdict(list)
-            for idx, item in enumerate(json_items, 1):
-                page = item.get('page', 'N/A')
-                try:
-                    page = int(page)
-                except Exception:
-                    pass
-                items_by_page[page].append(item)
-
-            #-----------------------------------------------------------------------
-            #------------------------------- Statistics ----------------------------
-            '''
-            resumo_rows = []
-            resumo_rows.append(["Página", "Produtos"])
-            for page in sorted(items_by_page):
-                resumo_rows.append([f"Pag: {page}", len(items_by_page[page])])
-            resumo_rows.append(["Total Produtos", total_items])
-            '''
-            #-----------------------------------------------------------------------
-            #------------------------------- Main Info -----------------------------
-
-            detalhes_rows = []
-            detalhes_rows.append(["Codigo", "Quantidade", "Observacoes"])
-            for page in sorted(items_by_page):
-                #detalhes_rows.append([f"Pag: {page}"])
-                for item in items_by_page[page]:
-                    detalhes_rows.append([
-                        "",
-                        item.get("Quantity", ""),
-                        item.get("All Values", ""),
-                    ])
-                #detalhes_rows.append([])
-
-            #-----------------------------------------------------------------------
-            #------------------------- Statistics + Main Info ----------------------
-            
-            all_rows = detalhes_rows
+    skipped = 0
+    try:
+        for json_file in json_files:
+            try:
+                json_path = os.path.join(jsons_folder, json_file)
+                if not os.path.exists(json_path):
+                    print(f"JSON não encontrado: {json_path}")
+                    continue
 
-            #-----------------------------------------------------------------------
-            #------------------------------ Write Excel ----------------------------
-            
-            with pd.ExcelWriter(excel_out_path, engine='xlsxwriter') as writer:
-                df = pd.DataFrame(all_rows)
-                df.to_excel(writer, sheet_name='Itens', index=False, header=False)
+                stat = os.stat(json_path)
+                entry = manifest.get(json_file)
+                if entry and os.path.splitext(entry.get("output", ""))[1] != f".{output_format}":
+                    entry = None  # Pedido noutro formato de saída
+                if is_up_to_date(entry, json_path, stat):
+                    skipped += 1
+                    continue
 
+                out_path = process_json_file(json_path, result_folder, stream=stream, output_format=output_format,
+                                             layouts=layouts)
+                manifest[json_file] = {
+                    "sha256": file_sha256(json_path),
+                    "mtime": stat.st_mtime,
+                    "size": stat.st_size,
+                    "output": out_path,
+                }
+
+            except Exception as e:
+                manifest.pop(json_file, None)
+                print(f"Ocorreu um erro ao processar {json_file}: {e}")
+    finally:
+        save_manifest(manifest_path, manifest)
+
+    if skipped:
+        print(f"{skipped} ficheiro(s) sem alterações ignorado(s).")
+
+def main_consolidated(consolidated_path, json_paths=None, stream=False, layouts=None):
+    # Os JSONs indicados (ou todos os da pasta) num único resultado (formato pela extensão), escrito à medida que
+    # cada um acaba. Sem manifest: o ficheiro é reescrito em cada execução, por isso tem de conter o lote inteiro.
+    # Devolve o número de JSONs que falharam, como o process_single.
+    if not json_paths:
+        jsons_folder = "../jsons"
+        if not os.path.exists(jsons_folder):
+            print("Pasta JSONs não encontrada.")
+            return 0
+        json_paths = [
+            os.path.join(jsons_folder, f) for f in sorted(os.listdir(jsons_folder)) if f.endswith('.json') or is_wordbin(f)
+        ]
+        if not json_paths:
+            print("Nenhum ficheiro JSON encontrado na pasta.")
+            return 0
+
+    failures = 0
+    os.makedirs(os.path.dirname(os.path.abspath(consolidated_path)), exist_ok=True)
+    with ConsolidatedWriter(consolidated_path) as consolidated:
+        for json_path in json_paths:
+            if not os.path.exists(json_path):
+                print(f"JSON não encontrado: {json_path}")
+                failures += 1
+                continue
+            try:
+                process_json_file(json_path, None, stream=stream, consolidated=consolidated, layouts=layouts)
+            except Exception as e:
+                print(f"Ocorreu um erro ao processar {os.path.basename(json_path)}: {e}")
+                failures += 1
+    print(f"{consolidated.documents} documento(s), {consolidated.items} itens -> {consolidated_path}")
+    return failures
+
+def process_single(json_paths, stream=False, output_format="xlsx", layouts=None):
+    # Devolve o número de JSONs que falharam (o CLI sai com código != 0, ver auto_reader.py --mode subprocess)
+    result_folder = os.path.join("..", "result")
+    os.makedirs(result_folder, exist_ok=True)
+    failures = 0
+    for json_path in json_paths:
+        if not os.path.exists(json_path):
+            print(f"JSON não encontrado: {json_path}")
+            failures += 1
+            continue
+        try:
+            process_json_file(json_path, result_folder, stream=stream, output_format=output_format, layouts=layouts)
         except Exception as e:
-            print(f"Ocorreu um erro ao processar {json_file}: {e}")
+            print(f"Ocorreu um erro ao processar {json_path}: {e}")
+            failures += 1
+    return failures
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extrai os itens dos JSONs e grava um Excel por documento.")
+    parser.add_argument("json_paths", nargs="*",
+                        help="JSONs a processar; sem argumentos processa ../jsons em modo batch (incremental)")
+    parser.add_argument("--force", action="store_true", help="Modo batch: ignora o manifest e reprocessa tudo")
+    parser.add_argument("--stream", action="store_true",
+                        help="Lê e processa uma página de cada vez (memória limitada pela maior página)")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="xlsx",
+                        help="Formato do resultado: xlsx (por defeito), csv ou parquet (precisa do pyarrow)")
+    parser.add_argument("--consolidated", metavar="FICHEIRO",
+                        help="Junta os itens dos JSONs indicados (ou de todos os de ../jsons) num único .xlsx/.csv/.parquet "
+                             "(com ficheiro, página e y)")
+    parser.add_argument("--layouts", nargs="?", const=LAYOUTS_PATH, metavar="FICHEIRO",
+                        help=f"Reutiliza os modelos de layout dos cabeçalhos já vistos (por defeito {LAYOUTS_PATH})")
+    add_profile_arguments(parser)
+    return parser.parse_args()
 
 #--------------------------------------------------------------------------------------------
 #---------------------------------------Show-Main--------------------------------------------
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    enable_from_args(args)
+    layouts = LayoutTemplates(args.layouts) if args.layouts else None
+    failures = 0
+    try:
+        if args.consolidated:
+            failures = main_consolidated(args.consolidated, args.json_paths, stream=args.stream, layouts=layouts)
+        elif args.json_paths:
+            failures = process_single(args.json_paths, stream=args.stream, output_format=args.output_format, layouts=layouts)
+        else:
+            main(force=args.force, stream=args.stream, output_format=args.output_format, layouts=layouts)
+    finally:
+        if layouts is not None:
+            layouts.save()
+            print(layouts.summary())
+    if failures:
+        sys.exit(1)
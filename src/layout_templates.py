@@ -0,0 +1,89 @@
+import os
+import json
+import hashlib
+
+LAYOUTS_PATH = os.path.abspath("../cache/layouts.json")
+MAX_TEMPLATES = 1000
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------Impressão Digital----------------------------------------------------------
+
+def layout_fingerprint(store, headers_coords, line_y, lines):
+    # Palavras-chave do cabeçalho (pela ordem do documento) e todas as palavras das suas linhas (por x), com
+    # texto, fonte, posição, largura e tamanho exatos. Tudo o que a deteção tira do cabeçalho depende só disto.
+    parts = []
+    for word in headers_coords.tolist():
+        parts.append((store.texts[store.text_ids[word]], float(store.x[word]), float(store.width[word]), float(store.y[word])))
+    for key in dict.fromkeys(line_y[headers_coords].tolist()):
+        for word in lines[key].tolist():
+            parts.append((
+                store.texts[store.text_ids[word]],
+                store.fonts[store.font_ids[word]],
+                float(store.x[word]),
+                float(store.width[word]),
+                float(store.y[word]),
+                float(store.size[word]),
+            ))
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#------------------------------------------------------------Modelos-----------------------------------------------------------------
+
+# Modelos de layout dos fornecedores recorrentes: impressão digital do cabeçalho -> colunas de quantidade
+# (x inicial, x final, y do cabeçalho) e largura de referência (delta_x). Numa página com um cabeçalho já visto
+# a extração usa as colunas guardadas e passa logo às linhas; se a impressão digital não bater, faz a deteção
+# completa e guarda o novo modelo. Gravado em JSON para servir entre execuções (só com um processo a escrever).
+class LayoutTemplates:
+    def __init__(self, path=None, max_templates=MAX_TEMPLATES):
+        self.path = path
+        self.max_templates = max_templates
+        self.templates = {}
+        self.hits = 0
+        self.misses = 0
+        self.changed = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.templates = json.load(f)
+            except (OSError, ValueError):
+                print(f"Modelos de layout inválidos, a começar do zero: {path}")
+
+    def __len__(self):
+        return len(self.templates)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.save()
+
+    def get(self, fingerprint):
+        template = self.templates.pop(fingerprint, None)
+        if template is None:
+            self.misses += 1
+            return None
+        # Volta para o fim: os modelos usados há mais tempo são os primeiros a sair
+        self.templates[fingerprint] = template
+        self.hits += 1
+        return template
+
+    def put(self, fingerprint, columns, delta_x):
+        self.templates[fingerprint] = {"columns": columns, "delta_x": delta_x}
+        while len(self.templates) > self.max_templates:
+            self.templates.pop(next(iter(self.templates)))
+        self.changed = True
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.templates, f)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        ratio = self.hits / lookups if lookups else 0
+        return f"Modelos de layout: {self.hits} hits, {self.misses} misses ({ratio:.0%}), {len(self)} modelos"
@@ -0,0 +1,94 @@
+import os
+import sys
+import argparse
+
+from pdf_to_json import EXTRACTION_MODES, iter_pages, iter_page_stores, JsonPagesWriter
+from extraction_backends import BACKENDS, DEFAULT_BACKEND
+from json_reader import ItemExtractor, record_items
+from result_writer import OUTPUT_FORMATS, output_path, write_items
+from word_store import WordStoreBuilder
+from wordbin import WordBinWriter, is_wordbin
+from layout_templates import LAYOUTS_PATH, LayoutTemplates
+from profiling import add_profile_arguments, enable_from_args, profile_document, current as current_profile
+
+RESULT_FOLDER = os.path.abspath("../result")
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#----------------------------------------------------------PDF -> Itens--------------------------------------------------------------
+
+# Caminho direto: as palavras extraídas de cada página vão da memória para o extrator de itens,
+# sem escrever e voltar a ler o JSON. O ficheiro de palavras só é gravado se for pedido (debug).
+def extract_items_pdf(pdf_path, workers=1, debug_output=None, y_margin_possible_values=None, mode="dict", layouts=None,
+                      backend=DEFAULT_BACKEND):
+    extractor = ItemExtractor(y_margin_possible_values, layouts)
+    profile = current_profile()
+    profile.mark()
+    if debug_output is None:
+        for store in iter_page_stores(pdf_path, workers=workers, mode=mode, backend=backend):
+            profile.lap("pdf_extract")
+            extractor.add_store(store)
+        return record_items(extractor)
+
+    writer = WordBinWriter(debug_output) if is_wordbin(debug_output) else JsonPagesWriter(debug_output)
+    with writer:
+        for page in iter_pages(pdf_path, workers=workers, mode=mode, backend=backend):
+            profile.lap("pdf_extract")
+            writer.write_page(page["page"], page["words"])
+            builder = WordStoreBuilder()
+            builder.add_words(page["page"], page["words"])
+            profile.lap("write_words")
+            extractor.add_store(builder.build())
+    return record_items(extractor)
+
+def process_pdf_direct(pdf_path, result_folder, workers=1, debug_output=None, mode="dict", output_format="xlsx",
+                       layouts=None, backend=DEFAULT_BACKEND):
+    with profile_document(pdf_path) as profile:
+        json_items = extract_items_pdf(pdf_path, workers=workers, debug_output=debug_output, mode=mode, layouts=layouts,
+                                       backend=backend)
+        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        out_path = output_path(result_folder, base_name, output_format)
+        with profile.stage("write_results"):
+            write_items(json_items, out_path, output_format)
+        return out_path, json_items
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extrai os itens de um PDF diretamente para Excel, sem JSON intermédio.")
+    parser.add_argument("pdf_paths", nargs="+")
+    parser.add_argument("--result", default=RESULT_FOLDER, help="Pasta para os Excels de resultado")
+    parser.add_argument("--workers", type=int, default=1, help="Divide as páginas de cada documento por N processos")
+    parser.add_argument("--debug-json", metavar="PASTA",
+                        help="Grava também a camada de palavras (<nome>.json) nesta pasta, para debug")
+    parser.add_argument("--mode", choices=EXTRACTION_MODES, default="dict", help="Modo de extração do PyMuPDF (ver pdf_to_json.py)")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="Motor de extração (ver extraction_backends.py)")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="xlsx", help="Formato do resultado (ver json_reader.py)")
+    parser.add_argument("--layouts", nargs="?", const=LAYOUTS_PATH, metavar="FICHEIRO",
+                        help="Reutiliza os modelos de layout dos cabeçalhos já vistos (ver layout_templates.py)")
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python pdf_to_items.py <pdf_path> [<pdf_path> ...] [--debug-json PASTA]")
+        sys.exit(1)
+    args = parse_args()
+    enable_from_args(args)
+    os.makedirs(args.result, exist_ok=True)
+    if args.debug_json:
+        os.makedirs(args.debug_json, exist_ok=True)
+    layouts = LayoutTemplates(args.layouts) if args.layouts else None
+    for pdf_path in args.pdf_paths:
+        debug_output = None
+        if args.debug_json:
+            base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+            debug_output = os.path.join(args.debug_json, f"{base_name}.json")
+        try:
+            excel_out_path, json_items = process_pdf_direct(pdf_path, args.result, workers=args.workers,
+                                                         debug_output=debug_output, mode=args.mode,
+                                                         output_format=args.output_format, layouts=layouts,
+                                                         backend=args.backend)
+            print(f"{pdf_path}: {len(json_items)} itens -> {excel_out_path}")
+        except Exception as e:
+            print(f"Ocorreu um erro ao processar {pdf_path}: {e}")
+    if layouts is not None:
+        layouts.save()
+        print(layouts.summary())
@@ -1,10 +1,43 @@
+import os
 import sys
 import fitz
 import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_words_with_rotation(page):
-    word_list = []
-    blocks = page.get_text("dict")["blocks"]
+from word_store import WordStoreBuilder
+from wordbin import WordBinWriter, is_wordbin
+from extraction_backends import BACKENDS, DEFAULT_BACKEND, iter_pdfplumber_pages, pdfplumber_page_range, pdfplumber_page_count
+from profiling import add_profile_arguments, enable_from_args, profile_document
+
+# Versão da camada de palavras: aumentar quando a extração passar a produzir palavras diferentes (invalida a cache)
+WORD_LAYER_VERSION = 1
+
+# Abaixo disto não compensa arrancar processos para dividir o documento
+MIN_PAGES_PER_SHARD = 8
+# Mais fatias do que workers equilibra páginas com custos diferentes
+SHARDS_PER_WORKER = 4
+
+# Modos de extração: "dict" é a chamada por defeito do PyMuPDF; "fast" pede o mesmo dict mas sem
+# descodificar as imagens (que eram descartadas de qualquer forma), com os mesmos spans e campos
+EXTRACTION_MODES = ("dict", "fast")
+FAST_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+def open_document(source):
+    # Caminho do PDF ou o próprio conteúdo em bytes (ex: recebido por HTTP), sem passar pelo disco
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def get_text_blocks(page, mode="dict"):
+    if mode == "fast":
+        return page.get_text("dict", flags=FAST_TEXT_FLAGS)["blocks"]
+    if mode == "dict":
+        return page.get_text("dict")["blocks"]
+    raise ValueError(f"Modo de extração desconhecido: {mode} (disponíveis: {', '.join(EXTRACTION_MODES)})")
+
+def iter_text_spans(page, mode="dict"):
+    blocks = get_text_blocks(page, mode)
     for block in blocks:
         if block.get("type") != 0:
             continue  # Ignora imagens
@@ -15,34 +48,189 @@ def extract_words_with_rotation(page):
                 height = span["bbox"][3] - span["bbox"][1]
                 if height > 3 * width or abs(angle) > 5:
                     continue  # Ignora possível texto vertical
-                word_list.append({
-                    "text": span["text"],
-                    "x": span["bbox"][0],
-                    "y": span["bbox"][1],
-                    "width": span["bbox"][2] - span["bbox"][0],
-                    "height": span["bbox"][3] - span["bbox"][1],
-                    "font": span.get("font"),
-                    "size": span.get("size"),
-                    "rotation": angle
-                })
+                yield span, angle
+
+def extract_words_with_rotation(page, mode="dict"):
+    word_list = []
+    for span, angle in iter_text_spans(page, mode):
+        word_list.append({
+            "text": span["text"],
+            "x": span["bbox"][0],
+            "y": span["bbox"][1],
+            "width": span["bbox"][2] - span["bbox"][0],
+            "height": span["bbox"][3] - span["bbox"][1],
+            "font": span.get("font"),
+            "size": span.get("size"),
+            "rotation": angle
+        })
     return word_list
 
-def process_pdf(pdf_path, output_path):
-    doc = fitz.open(pdf_path)
+# Mesmos campos que extract_words_with_rotation, mas direto para as colunas da WordStore (sem dict por span)
+def extract_page_into_store(page, builder, page_number, mode="dict"):
+    for span, angle in iter_text_spans(page, mode):
+        x0, y0, x1, y1 = span["bbox"]
+        builder.add(page_number, span["text"], x0, y0, x1 - x0, y1 - y0, span.get("font"), span.get("size"), angle)
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-------------------------------------------------------Extração por Páginas---------------------------------------------------------
+
+def extract_page_range(pdf_path, start, end, mode="dict", backend=DEFAULT_BACKEND):
+    # Cada worker abre o seu próprio documento (os handles do fitz não passam entre processos)
+    if backend == "pdfplumber":
+        return pdfplumber_page_range(pdf_path, start, end)
     pages = []
-    for page_number, page in enumerate(doc, start=1):
-        words = extract_words_with_rotation(page)
-        pages.append({
-            "page": page_number,
-            "words": words
-        })
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(pages, f, indent=2, ensure_ascii=False)
+    with fitz.open(pdf_path) as doc:
+        for page_index in range(start, end):
+            pages.append({
+                "page": page_index + 1,
+                "words": extract_words_with_rotation(doc[page_index], mode)
+            })
+    return pages
+
+def split_page_ranges(page_count, workers):
+    shard_count = min(workers * SHARDS_PER_WORKER, max(1, page_count // MIN_PAGES_PER_SHARD))
+    base, extra = divmod(page_count, shard_count)
+    ranges = []
+    start = 0
+    for i in range(shard_count):
+        end = start + base + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Motor de extração desconhecido: {backend} (disponíveis: {', '.join(BACKENDS)})")
+
+def iter_pages(pdf_path, workers=1, mode="dict", backend=DEFAULT_BACKEND):
+    # Gera as páginas uma a uma (ou uma fatia de cada vez com workers), sem guardar o documento inteiro.
+    # O motor (ver extraction_backends.py) só muda de onde vêm as palavras; o esquema é o mesmo.
+    check_backend(backend)
+    if workers <= 1 and backend == "pdfplumber":
+        yield from iter_pdfplumber_pages(pdf_path)
+        return
+    if workers <= 1:
+        with open_document(pdf_path) as doc:
+            for page_number, page in enumerate(doc, start=1):
+                words = extract_words_with_rotation(page, mode)
+                yield {
+                    "page": page_number,
+                    "words": words
+                }
+        return
+
+    page_count = count_pages(pdf_path, backend)
+    ranges = split_page_ranges(page_count, workers)
+    if len(ranges) == 1:
+        yield from extract_page_range(pdf_path, 0, page_count, mode, backend)
+        return
+
+    # As fatias são contíguas e o map mantém a ordem, por isso basta concatenar
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        starts, ends = zip(*ranges)
+        modes = [mode] * len(ranges)
+        backends = [backend] * len(ranges)
+        for shard in executor.map(extract_page_range, [pdf_path] * len(ranges), starts, ends, modes, backends):
+            yield from shard
+
+def count_pages(pdf_path, backend=DEFAULT_BACKEND):
+    if backend == "pdfplumber":
+        return pdfplumber_page_count(pdf_path)
+    with open_document(pdf_path) as doc:
+        return doc.page_count
+
+def extract_pages(pdf_path, workers=1, mode="dict", backend=DEFAULT_BACKEND):
+    return list(iter_pages(pdf_path, workers=workers, mode=mode, backend=backend))
+
+def iter_page_stores(pdf_path, workers=1, mode="dict", backend=DEFAULT_BACKEND):
+    # Uma WordStore por página, numerada pela posição no documento, sem passar por dicts (em série)
+    if workers <= 1 and backend == DEFAULT_BACKEND:
+        with open_document(pdf_path) as doc:
+            for page_number, page in enumerate(doc, start=1):
+                builder = WordStoreBuilder()
+                extract_page_into_store(page, builder, page_number, mode)
+                yield builder.build()
+        return
+    # Com workers (ou com o pdfplumber) as páginas já chegam como dicts
+    for page in iter_pages(pdf_path, workers=workers, mode=mode, backend=backend):
+        builder = WordStoreBuilder()
+        builder.add_words(page["page"], page["words"])
+        yield builder.build()
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Escrita------------------------------------------------------------------
+
+# Escreve a lista de páginas uma a uma, com o mesmo texto que json.dump(pages, f, indent=2, ensure_ascii=False)
+class JsonPagesWriter:
+    def __init__(self, path):
+        self.f = open(path, "w", encoding="utf-8")
+        self.page_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Com erro o ficheiro fica incompleto (sem o "]" final), para nunca parecer um JSON válido
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+
+    def write_page(self, page_number, words):
+        page_json = json.dumps({"page": page_number, "words": words}, indent=2, ensure_ascii=False)
+        self.f.write("[\n  " if self.page_count == 0 else ",\n  ")
+        self.f.write(page_json.replace("\n", "\n  "))
+        self.page_count += 1
+
+    def close(self):
+        if self.f.closed:
+            return
+        self.f.write("\n]" if self.page_count else "[]")
+        self.f.close()
+
+def process_pdf(pdf_path, output_path, workers=1, mode="dict", backend=DEFAULT_BACKEND):
+    # A extensão do destino escolhe o formato: .wbin (binário em colunas) ou JSON.
+    # Escreve num ficheiro temporário que só substitui o destino no fim: com erro (PDF que não abre, falha a meio)
+    # não fica nenhum ficheiro de palavras, nem vazio nem truncado.
+    writer_class = WordBinWriter if is_wordbin(output_path) else JsonPagesWriter
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    page_count = 0
+    with profile_document(pdf_path) as profile:
+        profile.mark()
+        try:
+            with writer_class(tmp_path) as writer:
+                for page in iter_pages(pdf_path, workers=workers, mode=mode, backend=backend):
+                    profile.lap("pdf_extract")
+                    writer.write_page(page["page"], page["words"])
+                    profile.lap("write_words")
+                    profile.count("pdf_pages")
+                    profile.count("pdf_words", len(page["words"]))
+                    page_count += 1
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, output_path)
+        profile.lap("write_words")
+    return page_count
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Converte um PDF no JSON de palavras com coordenadas.")
+    parser.add_argument("pdf_path")
+    parser.add_argument("json_path", help="Destino; com extensão .wbin grava no formato binário")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Divide as páginas do documento por N processos (útil para PDFs com centenas de páginas)")
+    parser.add_argument("--mode", choices=EXTRACTION_MODES, default="dict",
+                        help="fast: não descodifica imagens (mesmas palavras, mais rápido em PDFs com imagens)")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help="Motor de extração (ver extraction_backends.py; compare com 'python extraction_backends.py PDFs')")
+    add_profile_arguments(parser)
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Uso: python pdf_to_json.py <pdf_path> <json_path>")
+    if len(sys.argv) < 3:
+        print("Uso: python pdf_to_json.py <pdf_path> <json_path> [--workers N] [--mode dict|fast]")
         sys.exit(1)
-    pdf_path = sys.argv[1]
-    json_path = sys.argv[2]
-    process_pdf(pdf_path, json_path)
+    args = parse_args()
+    enable_from_args(args)
+    process_pdf(args.pdf_path, args.json_path, workers=args.workers, mode=args.mode, backend=args.backend)
@@ -0,0 +1,113 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+
+STORE_NAME = ".processed.sqlite"
+
+# Estados de cada PDF (pela hash do conteúdo)
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    sha256      TEXT PRIMARY KEY,
+    path        TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime       REAL NOT NULL,
+    status      TEXT NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    seconds     REAL,
+    json_path   TEXT,
+    output_path TEXT,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+"""
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------Registo de Processados---------------------------------------------------------
+
+# Registo persistente (SQLite) dos PDFs já processados, pela hash do conteúdo e não pelo nome:
+#  - depois de reiniciar, o que já está "done" não volta a ser processado;
+#  - um PDF igual byte a byte com outro nome é detetado como duplicado e ignorado;
+#  - um PDF renomeado é reconhecido (a entrada passa a apontar para o nome novo);
+#  - um PDF diferente que reutiliza um nome antigo tem outra hash, por isso é processado.
+# Uma única ligação partilhada pelos threads do watcher, protegida por um lock.
+class ProcessedStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get(self, sha256):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM files WHERE sha256 = ?", (sha256,)).fetchone()
+        return dict(row) if row else None
+
+    def find_unchanged(self, path, stat):
+        # Mesmo caminho, tamanho e mtime de um PDF já processado: não é preciso ler o ficheiro
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM files WHERE path = ? AND size = ? AND mtime = ? AND status = ?",
+                (path, stat.st_size, stat.st_mtime, STATUS_DONE)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, sha256, path, stat):
+        # Devolve (True, None) se este thread deve processar o PDF, ou (False, entrada) se já foi / está a ser processado
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT * FROM files WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is not None and row["status"] in (STATUS_DONE, STATUS_PROCESSING):
+                entry = dict(row)
+                if row["status"] == STATUS_DONE and row["path"] != path and not os.path.exists(row["path"]):
+                    # Renomeado: o nome antigo já não existe, passa a contar o novo
+                    self.conn.execute(
+                        "UPDATE files SET path = ?, size = ?, mtime = ? WHERE sha256 = ?",
+                        (path, stat.st_size, stat.st_mtime, sha256)
+                    )
+                return False, entry
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (sha256, path, size, mtime, status, started_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, path, stat.st_size, stat.st_mtime, STATUS_PROCESSING, time.time())
+            )
+            return True, None
+
+    def finish(self, sha256, seconds, json_path=None, output_path=None, error=None):
+        status = STATUS_FAILED if error else STATUS_DONE
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE files SET status = ?, finished_at = ?, seconds = ?, json_path = ?, output_path = ?, error = ? "
+                "WHERE sha256 = ?",
+                (status, time.time(), seconds, json_path, output_path, error, sha256)
+            )
+
+    def reset_interrupted(self):
+        # Entradas que ficaram "processing" (o watcher foi parado a meio) voltam a ser processadas
+        with self.lock, self.conn:
+            return self.conn.execute(
+                "UPDATE files SET status = ? WHERE status = ?", (STATUS_FAILED, STATUS_PROCESSING)
+            ).rowcount
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Instrumentação opcional por etapa e por documento. Fica ligada por variáveis de ambiente para chegar
+# também aos workers (ProcessPoolExecutor) e aos subprocessos do auto_reader sem passar parâmetros.
+PROFILE_ENV = "PDF_READER_PROFILE"                         # ficheiro JSON Lines com um registo por documento
+CPROFILE_ENV = "PDF_READER_CPROFILE"                       # pasta para os .prof do cProfile
+CPROFILE_MIN_SECONDS_ENV = "PDF_READER_CPROFILE_MIN_SECONDS"  # só grava o .prof de documentos mais lentos do que isto
+
+state = threading.local()
+emit_lock = threading.Lock()
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#----------------------------------------------------------Perfis--------------------------------------------------------------------
+
+class NullProfile:
+    # Usado quando a instrumentação está desligada: todas as chamadas são no-ops
+    enabled = False
+
+    def mark(self):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def stage(self, stage):
+        return nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+NULL_PROFILE = NullProfile()
+
+class DocumentProfile:
+    enabled = True
+
+    def __init__(self, document):
+        self.document = document
+        self.stages = {}
+        self.counts = {}
+        self.values = {}
+        self.last = time.perf_counter()
+
+    def add_time(self, stage, seconds):
+        entry = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+
+    def mark(self):
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        # Soma à etapa o tempo desde o último mark/lap (evita reindentar blocos inteiros em "with")
+        now = time.perf_counter()
+        self.add_time(stage, now - self.last)
+        self.last = now
+
+    @contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last = time.perf_counter()
+            self.add_time(stage, self.last - start)
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def record(self, seconds, error=None, cprofile_path=None):
+        return {
+            "document": self.document,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "pid": os.getpid(),
+            "seconds": seconds,
+            "stages": self.stages,
+            "counts": self.counts,
+            **self.values,
+            "error": error,
+            "cprofile": cprofile_path,
+        }
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------Ativação--------------------------------------------------------------------
+
+def enable(output_path, cprofile_folder=None, cprofile_min_seconds=0.0):
+    os.environ[PROFILE_ENV] = os.path.abspath(output_path)
+    if cprofile_folder:
+        os.environ[CPROFILE_ENV] = os.path.abspath(cprofile_folder)
+        os.environ[CPROFILE_MIN_SECONDS_ENV] = str(cprofile_min_seconds)
+
+def is_enabled():
+    return bool(os.environ.get(PROFILE_ENV))
+
+def current():
+    return getattr(state, "profile", None) or NULL_PROFILE
+
+def emit(record):
+    # Uma linha por write em modo append: vários processos podem escrever no mesmo ficheiro
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with emit_lock, open(os.environ[PROFILE_ENV], "a", encoding="utf-8") as f:
+        f.write(line)
+
+def dump_cprofile(profiler, document):
+    folder = os.environ[CPROFILE_ENV]
+    os.makedirs(folder, exist_ok=True)
+    base_name = os.path.splitext(os.path.basename(document))[0]
+    path = os.path.join(folder, f"{base_name}-{os.getpid()}-{int(time.time() * 1000)}.prof")
+    profiler.dump_stats(path)
+    return path
+
+@contextmanager
+def profile_document(document):
+    # Abre o registo do documento; chamadas encaixadas (ex: process_pdf dentro do auto_reader) juntam-se ao registo já aberto
+    active = getattr(state, "profile", None)
+    if active is not None or not is_enabled():
+        yield active or NULL_PROFILE
+        return
+
+    profile = DocumentProfile(document)
+    profiler = cProfile.Profile() if os.environ.get(CPROFILE_ENV) else None
+    state.profile = profile
+    error = None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield profile
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        state.profile = None
+        seconds = time.perf_counter() - start
+        cprofile_path = None
+        if profiler is not None and seconds >= float(os.environ.get(CPROFILE_MIN_SECONDS_ENV, 0)):
+            cprofile_path = dump_cprofile(profiler, document)
+        emit(profile.record(seconds, error, cprofile_path))
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#------------------------------------------------------------CLI---------------------------------------------------------------------
+
+def add_profile_arguments(parser):
+    parser.add_argument("--profile", metavar="FICHEIRO",
+                        help="Grava tempos e contagens por etapa e por documento neste ficheiro (JSON Lines)")
+    parser.add_argument("--cprofile", metavar="PASTA", help="Com --profile: grava também um .prof do cProfile por documento")
+    parser.add_argument("--cprofile-min-seconds", type=float, default=0.0,
+                        help="Só grava o .prof dos documentos que demoram pelo menos isto (para apanhar os casos lentos)")
+
+def enable_from_args(args):
+    if args.profile:
+        enable(args.profile, args.cprofile, args.cprofile_min_seconds)
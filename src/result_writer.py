@@ -0,0 +1,161 @@
+import os
+import csv
+from collections import defaultdict
+
+# Formatos de saída dos itens; o xlsx é o de sempre, csv e parquet são para sistemas que não precisam do Excel
+OUTPUT_FORMATS = ("xlsx", "csv", "parquet")
+HEADER = ["Codigo", "Quantidade", "Observacoes"]
+SHEET_NAME = "Itens"
+# Linhas por row group do parquet (só este bloco fica em memória de cada vez)
+PARQUET_BATCH_ROWS = 65536
+
+def output_format_from_path(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension not in OUTPUT_FORMATS:
+        raise ValueError(f"Formato de saída desconhecido: {path} (disponíveis: {', '.join(OUTPUT_FORMATS)})")
+    return extension
+
+def output_path(result_folder, base_name, output_format="xlsx"):
+    return os.path.join(result_folder, f"{base_name}.{output_format}")
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#------------------------------------------------------------Linhas------------------------------------------------------------------
+
+def items_in_page_order(json_items):
+    # Mesma ordem que o Excel sempre teve: páginas por ordem, e dentro de cada página pela ordem de extração
+    items_by_page = defaultdict(list)
+    for item in json_items:
+        page = item.get('page', 'N/A')
+        try:
+            page = int(page)
+        except Exception:
+            pass
+        items_by_page[page].append(item)
+
+    for page in sorted(items_by_page):
+        yield from items_by_page[page]
+
+def item_rows(json_items):
+    for item in items_in_page_order(json_items):
+        yield ["", item.get("Quantity", ""), item.get("All Values", "")]
+
+def consolidated_rows(source, json_items):
+    for item in items_in_page_order(json_items):
+        yield [source, item.get("page", ""), item.get("y", ""), "", item.get("Quantity", ""), item.get("All Values", "")]
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------Escrita------------------------------------------------------------------
+
+# Destinos de linhas: abrem o ficheiro uma vez e recebem linhas à medida (write_rows pode ser chamado várias vezes),
+# por isso servem tanto para um documento como para juntar um lote inteiro num único ficheiro
+class XlsxRowSink:
+    def __init__(self, out_path, header):
+        import xlsxwriter
+
+        # constant_memory: cada linha é escrita no disco assim que a seguinte começa (sem DataFrame nem folha em memória).
+        # write_row usa o mesmo write() que o pandas usava, por isso as células ficam iguais.
+        self.workbook = xlsxwriter.Workbook(out_path, {"constant_memory": True})
+        self.worksheet = self.workbook.add_worksheet(SHEET_NAME)
+        self.row_index = 0
+        self.write_rows([header])
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.worksheet.write_row(self.row_index, 0, row)
+            self.row_index += 1
+
+    def close(self):
+        self.workbook.close()
+
+class CsvRowSink:
+    def __init__(self, out_path, header):
+        self.f = open(out_path, "w", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(header)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+class ParquetRowSink:
+    def __init__(self, out_path, header):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("O formato parquet precisa do pyarrow (pip install pyarrow)")
+
+        # O cabeçalho vira o nome das colunas; as linhas acumulam até PARQUET_BATCH_ROWS e saem num row group
+        self.pa = pa
+        self.schema = pa.schema([(name, pa.string()) for name in header])
+        self.writer = pq.ParquetWriter(out_path, self.schema)
+        self.columns = [[] for _ in header]
+        self.flushed = False
+
+    def flush(self):
+        pa = self.pa
+        self.writer.write_table(pa.table([pa.array(column, type=pa.string()) for column in self.columns], schema=self.schema))
+        self.columns = [[] for _ in self.columns]
+        self.flushed = True
+
+    def write_rows(self, rows):
+        for row in rows:
+            for column, value in zip(self.columns, row):
+                column.append(None if value is None else str(value))
+            if len(self.columns[0]) >= PARQUET_BATCH_ROWS:
+                self.flush()
+
+    def close(self):
+        if self.columns[0] or not self.flushed:
+            self.flush()
+        self.writer.close()
+
+ROW_SINKS = {
+    "xlsx": XlsxRowSink,
+    "csv": CsvRowSink,
+    "parquet": ParquetRowSink,
+}
+
+def open_row_sink(out_path, header, output_format=None):
+    output_format = output_format or output_format_from_path(out_path)
+    return ROW_SINKS[output_format](out_path, header)
+
+def write_items(json_items, out_path, output_format=None):
+    # Cabeçalho + uma linha por item, escritos à medida (o formato vem da extensão se não for indicado)
+    sink = open_row_sink(out_path, HEADER, output_format)
+    try:
+        sink.write_rows(item_rows(json_items))
+    finally:
+        sink.close()
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------Consolidado----------------------------------------------------------------
+
+CONSOLIDATED_HEADER = ["Ficheiro", "Pagina", "Y", *HEADER]
+
+# Um único resultado para o lote inteiro: os itens de cada documento são acrescentados assim que o documento acaba,
+# com o ficheiro de origem, a página e o y de cada item. A memória não cresce com o tamanho do lote.
+class ConsolidatedWriter:
+    def __init__(self, out_path, output_format=None):
+        self.out_path = out_path
+        self.sink = open_row_sink(out_path, CONSOLIDATED_HEADER, output_format)
+        self.documents = 0
+        self.items = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write_document(self, source, json_items):
+        self.sink.write_rows(consolidated_rows(source, json_items))
+        self.documents += 1
+        self.items += len(json_items)
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
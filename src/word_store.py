@@ -0,0 +1,121 @@
+import numpy as np
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------Word Store-----------------------------------------------------------------
+
+# Camada de palavras em colunas: um array por campo (x, y, width, ...) e uma posição por palavra,
+# pela ordem do documento. Textos e fontes ficam numa tabela interna e as palavras guardam só o id.
+class WordStore:
+    def __init__(self, texts, fonts, text_ids, font_ids, x, y, width, height, size, rotation, page):
+        self.texts = texts
+        self.fonts = fonts
+        self.text_ids = text_ids
+        self.font_ids = font_ids
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.size = size
+        self.rotation = rotation
+        self.page = page
+        # Texto sem espaços nas pontas, calculado uma vez por texto distinto
+        self.stripped = [t.strip() for t in texts]
+        # Preenchidos por classify()
+        self.quantity_texts = None
+        self.is_keyword = None
+        self.is_quantity = None
+
+    def __len__(self):
+        return len(self.x)
+
+    @classmethod
+    def from_pages(cls, pages):
+        # As páginas são numeradas pela posição na lista (como em extract_items_json)
+        builder = WordStoreBuilder()
+        for page_num, page in enumerate(pages, 1):
+            builder.add_words(page_num, page["words"])
+        return builder.build()
+
+    def page_ranges(self):
+        # (página, início, fim) de cada página com palavras; as palavras estão agrupadas por página
+        if not len(self):
+            return []
+        starts = np.flatnonzero(np.diff(self.page)) + 1
+        starts = np.concatenate(([0], starts))
+        ends = np.concatenate((starts[1:], [len(self)]))
+        return [(int(self.page[s]), int(s), int(e)) for s, e in zip(starts, ends)]
+
+    def classify(self, classifier):
+        # classifier(texto) -> (normalizado, é_palavra_chave, é_quantidade, quantidade_normalizada);
+        # corre uma vez por texto distinto e os resultados ficam por palavra
+        if self.quantity_texts is not None:
+            return
+        classes = [classifier(t) for t in self.texts]
+        self.quantity_texts = [c[3] for c in classes]
+        self.is_keyword = np.array([c[1] for c in classes], dtype=bool)[self.text_ids]
+        self.is_quantity = np.array([c[2] for c in classes], dtype=bool)[self.text_ids]
+
+    def sort_by_x(self, indices):
+        # Ordenação estável: empates em x mantêm a ordem de entrada
+        return indices[np.argsort(self.x[indices], kind="stable")]
+
+class WordStoreBuilder:
+    def __init__(self):
+        # dict texto -> id; a ordem de inserção é a própria tabela
+        self.text_table = {}
+        self.font_table = {}
+        self.text_ids = []
+        self.font_ids = []
+        self.x = []
+        self.y = []
+        self.width = []
+        self.height = []
+        self.size = []
+        self.rotation = []
+        self.page = []
+
+    def add(self, page, text, x, y, width, height, font, size, rotation):
+        self.page.append(page)
+        self.text_ids.append(self.text_table.setdefault(text, len(self.text_table)))
+        self.font_ids.append(self.font_table.setdefault(font, len(self.font_table)))
+        self.x.append(x)
+        self.y.append(y)
+        self.width.append(width)
+        self.height.append(height)
+        self.size.append(np.nan if size is None else size)
+        self.rotation.append(rotation)
+
+    def add_words(self, page, words):
+        # Coluna a coluna: muito mais rápido do que chamar add() por palavra
+        text_table = self.text_table
+        font_table = self.font_table
+        self.page.extend([page] * len(words))
+        self.text_ids.extend([text_table.setdefault(w["text"], len(text_table)) for w in words])
+        self.font_ids.extend([font_table.setdefault(w.get("font"), len(font_table)) for w in words])
+        self.x.extend([w["x"] for w in words])
+        self.y.extend([w["y"] for w in words])
+        self.width.extend([w.get("width", 0) for w in words])
+        self.height.extend([w.get("height", 0) for w in words])
+        self.size.extend([np.nan if w.get("size") is None else w["size"] for w in words])
+        self.rotation.extend([w.get("rotation", 0) for w in words])
+
+    def build(self):
+        page = np.array(self.page, dtype=np.int32)
+        columns = [
+            np.array(self.text_ids, dtype=np.int32),
+            np.array(self.font_ids, dtype=np.int32),
+            np.array(self.x, dtype=np.float64),
+            np.array(self.y, dtype=np.float64),
+            np.array(self.width, dtype=np.float64),
+            np.array(self.height, dtype=np.float64),
+            np.array(self.size, dtype=np.float64),
+            np.array(self.rotation, dtype=np.float64),
+        ]
+        # Garante palavras agrupadas por página sem mudar a ordem dentro de cada página
+        if len(page) and np.any(np.diff(page) < 0):
+            order = np.argsort(page, kind="stable")
+            page = page[order]
+            columns = [c[order] for c in columns]
+        text_ids, font_ids, x, y, width, height, size, rotation = columns
+        return WordStore(list(self.text_table), list(self.font_table), text_ids, font_ids,
+                         x, y, width, height, size, rotation, page)
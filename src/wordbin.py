@@ -0,0 +1,232 @@
+import sys
+import json
+import mmap
+import struct
+import argparse
+import numpy as np
+
+from word_store import WordStore
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------Formato .wbin---------------------------------------------------------------
+
+# Alternativa binária ao JSON de palavras, em colunas e com acesso direto a cada página:
+#
+#   cabeçalho   MAGIC + versão
+#   página      page_number, n_palavras, tamanho_textos (u32)
+#               x, y, width, height, size, rotation (float64[n] cada)
+#               font_ids (int32[n]), text_offsets (uint32[n + 1]), textos utf-8 (alinhado a 8 bytes)
+#   ...
+#   rodapé      tabela de fontes (JSON), offsets das páginas (uint64[n_páginas])
+#   trailer     offset_fontes, offset_indice (u64), n_páginas (u32), END_MAGIC
+#
+# O índice fica no fim para as páginas poderem ser escritas à medida que são extraídas.
+
+WORDBIN_EXT = ".wbin"
+MAGIC = b"PDFWORDS"
+END_MAGIC = b"PDFWEND!"
+VERSION = 1
+
+HEADER = struct.Struct("<8sI4x")
+PAGE_HEADER = struct.Struct("<III4x")
+TRAILER = struct.Struct("<QQI4x8s")
+FLOAT_COLUMNS = ("x", "y", "width", "height", "size", "rotation")
+
+def is_wordbin(path):
+    return path.lower().endswith(WORDBIN_EXT)
+
+def padding(length):
+    return b"\0" * (-length % 8)
+
+class WordBinWriter:
+    def __init__(self, path):
+        self.f = open(path, "wb")
+        self.f.write(HEADER.pack(MAGIC, VERSION))
+        self.font_table = {}
+        self.page_offsets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Com erro não escreve o trailer: o leitor recusa o ficheiro em vez de o ler truncado
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+
+    def write_columns(self, page_number, texts, fonts, x, y, width, height, size, rotation):
+        font_ids = np.array([self.font_table.setdefault(font, len(self.font_table)) for font in fonts], dtype=np.int32)
+        encoded = [text.encode("utf-8") for text in texts]
+        text_offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+        np.cumsum([len(e) for e in encoded], out=text_offsets[1:])
+        blob = b"".join(encoded)
+
+        self.page_offsets.append(self.f.tell())
+        self.f.write(PAGE_HEADER.pack(page_number, len(encoded), len(blob)))
+        for column in (x, y, width, height, size, rotation):
+            self.f.write(np.asarray(column, dtype="<f8").tobytes())
+        self.f.write(font_ids.astype("<i4").tobytes())
+        offsets_bytes = text_offsets.astype("<u4").tobytes()
+        self.f.write(offsets_bytes)
+        self.f.write(blob)
+        self.f.write(padding(len(font_ids) * 4 + len(offsets_bytes) + len(blob)))
+
+    def write_page(self, page_number, words):
+        self.write_columns(
+            page_number,
+            [w["text"] for w in words],
+            [w.get("font") for w in words],
+            [w["x"] for w in words],
+            [w["y"] for w in words],
+            [w.get("width", 0) for w in words],
+            [w.get("height", 0) for w in words],
+            [np.nan if w.get("size") is None else w["size"] for w in words],
+            [w.get("rotation", 0) for w in words],
+        )
+
+    def close(self):
+        if self.f.closed:
+            return
+        font_table_offset = self.f.tell()
+        fonts = json.dumps(list(self.font_table), ensure_ascii=False).encode("utf-8")
+        self.f.write(fonts + padding(len(fonts)))
+        index_offset = self.f.tell()
+        self.f.write(np.array(self.page_offsets, dtype="<u8").tobytes())
+        self.f.write(TRAILER.pack(font_table_offset, index_offset, len(self.page_offsets), END_MAGIC))
+        self.f.close()
+
+class WordBinReader:
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        size = self.f.seek(0, 2)
+        if size < HEADER.size + TRAILER.size:
+            self.f.close()
+            raise ValueError(f"Ficheiro {WORDBIN_EXT} inválido: {path}")
+        self.buffer = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = HEADER.unpack_from(self.buffer, 0)
+        font_table_offset, index_offset, page_count, end_magic = TRAILER.unpack_from(self.buffer, size - TRAILER.size)
+        if magic != MAGIC or end_magic != END_MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Ficheiro {WORDBIN_EXT} inválido ou incompleto: {path}")
+
+        self.fonts = json.loads(bytes(self.buffer[font_table_offset:index_offset]).rstrip(b"\0").decode("utf-8"))
+        self.page_offsets = np.frombuffer(self.buffer, dtype="<u8", count=page_count, offset=index_offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.page_offsets)
+
+    def close(self):
+        # Os arrays devolvidos são cópias, por isso o mmap pode ser fechado em segurança
+        if not self.f.closed:
+            self.page_offsets = None
+            self.buffer.close()
+            self.f.close()
+
+    def read_columns(self, index):
+        # Leitura direta da página index (0-based) sem tocar nas outras
+        offset = int(self.page_offsets[index])
+        page_number, count, text_length = PAGE_HEADER.unpack_from(self.buffer, offset)
+        offset += PAGE_HEADER.size
+        columns = {"page": page_number}
+        for name in FLOAT_COLUMNS:
+            columns[name] = np.frombuffer(self.buffer, dtype="<f8", count=count, offset=offset).astype(np.float64)
+            offset += 8 * count
+        columns["font_ids"] = np.frombuffer(self.buffer, dtype="<i4", count=count, offset=offset).astype(np.int32)
+        offset += 4 * count
+        text_offsets = np.frombuffer(self.buffer, dtype="<u4", count=count + 1, offset=offset).tolist()
+        offset += 4 * (count + 1)
+        blob = self.buffer[offset:offset + text_length]
+        columns["texts"] = [blob[a:b].decode("utf-8") for a, b in zip(text_offsets, text_offsets[1:])]
+        return columns
+
+    def read_page(self, index):
+        columns = self.read_columns(index)
+        words = []
+        for i, text in enumerate(columns["texts"]):
+            size = columns["size"][i]
+            words.append({
+                "text": text,
+                "x": float(columns["x"][i]),
+                "y": float(columns["y"][i]),
+                "width": float(columns["width"][i]),
+                "height": float(columns["height"][i]),
+                "font": self.fonts[columns["font_ids"][i]],
+                "size": None if np.isnan(size) else float(size),
+                "rotation": float(columns["rotation"][i])
+            })
+        return {"page": columns["page"], "words": words}
+
+    def iter_pages(self):
+        for index in range(len(self)):
+            yield self.read_page(index)
+
+    def read_store(self, indices=None):
+        # Páginas numeradas pela posição no ficheiro (como extract_items_json numera a lista de páginas do JSON)
+        indices = range(len(self)) if indices is None else indices
+        text_table = {}
+        parts = {name: [] for name in FLOAT_COLUMNS + ("font_ids", "text_ids", "page")}
+        for index in indices:
+            columns = self.read_columns(index)
+            count = len(columns["texts"])
+            for name in FLOAT_COLUMNS + ("font_ids",):
+                parts[name].append(columns[name])
+            parts["text_ids"].append(np.array(
+                [text_table.setdefault(t, len(text_table)) for t in columns["texts"]], dtype=np.int32))
+            parts["page"].append(np.full(count, index + 1, dtype=np.int32))
+
+        def join(name, dtype):
+            return np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)
+
+        return WordStore(
+            list(text_table), list(self.fonts),
+            join("text_ids", np.int32), join("font_ids", np.int32),
+            *(join(name, np.float64) for name in FLOAT_COLUMNS),
+            join("page", np.int32)
+        )
+
+#------------------------------------------------------------------------------------------------------------------------------------
+#----------------------------------------------------------Conversão-----------------------------------------------------------------
+
+def write_pages(path, pages):
+    with WordBinWriter(path) as writer:
+        for page in pages:
+            writer.write_page(page["page"], page["words"])
+
+def read_pages(path):
+    with WordBinReader(path) as reader:
+        return list(reader.iter_pages())
+
+def json_to_wordbin(json_path, wbin_path):
+    with open(json_path, encoding="utf-8") as f:
+        pages = json.load(f)
+    write_pages(wbin_path, pages)
+
+def wordbin_to_json(wbin_path, json_path):
+    # Os números voltam como float (ex: rotation 0 -> 0.0)
+    pages = read_pages(wbin_path)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(pages, f, indent=2, ensure_ascii=False)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=f"Converte o JSON de palavras para o formato binário {WORDBIN_EXT} e vice-versa.")
+    parser.add_argument("input_path")
+    parser.add_argument("output_path")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(f"Uso: python wordbin.py <entrada.json> <saida{WORDBIN_EXT}>  ou  python wordbin.py <entrada{WORDBIN_EXT}> <saida.json>")
+        sys.exit(1)
+    args = parse_args()
+    if is_wordbin(args.input_path):
+        wordbin_to_json(args.input_path, args.output_path)
+    else:
+        json_to_wordbin(args.input_path, args.output_path)